@@ -0,0 +1,51 @@
+'''
+Per-request cost of GET /questions as the bank grows.
+
+The "legacy" column reproduces the old paginate_questions(): load the whole
+table, format every row and slice out one page. The endpoint columns hit the
+real app, which only loads the requested page.
+
+    python benchmarks/bench_pagination.py [--database URL] [--sizes ...]
+'''
+import argparse
+
+from common import make_app, seed, timeit
+from models import Question
+
+QUESTIONS_PER_PAGE = 10
+
+
+def legacy_page(page):
+    start = (page - 1) * QUESTIONS_PER_PAGE
+    questions = [question.format() for question in Question.query.all()]
+    return questions[start:start + QUESTIONS_PER_PAGE]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database', default=None)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    # without the response cache, so the SQL path is what gets timed
+    app = make_app(args.database, RESPONSE_CACHE_SIZE=0)
+    client = app.test_client()
+
+    print('%10s %16s %16s %16s' % (
+        'rows', 'legacy p1 (ms)', 'page 1 (ms)', 'page 50 (ms)'))
+    with app.app_context():
+        for size in args.sizes:
+            seed(size)
+            legacy, _ = timeit(
+                lambda: legacy_page(1), max(3, args.repeat // 10))
+            first, _ = timeit(
+                lambda: client.get('/questions?page=1'), args.repeat)
+            deep, _ = timeit(
+                lambda: client.get('/questions?page=50'), args.repeat)
+            print('%10d %16.2f %16.2f %16.2f' % (size, legacy, first, deep))
+
+
+if __name__ == '__main__':
+    main()
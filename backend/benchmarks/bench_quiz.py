@@ -0,0 +1,53 @@
+'''
+Cost of drawing one quiz question as the category and the history grow.
+
+The "legacy" column reproduces the old get_random_question() once the rows
+are loaded: random indices into the category until one is not in the
+previous_questions list. The "pool" column is quizpool.IdPool.sample(),
+which only depends on the history length. No database needed; history is
+given as a fraction of the category already seen.
+
+    python benchmarks/bench_quiz.py [--sizes ...] [--seen 0 0.5 0.9 0.99]
+'''
+import argparse
+import random
+
+from common import timeit
+from quizpool import IdPool
+
+
+def legacy_draw(ids, previous, rng):
+    if (len(previous) == len(ids)):
+        return None
+    question_id = ids[round(rng.random() * (len(ids) - 1))]
+    while (question_id in previous):
+        question_id = ids[round(rng.random() * (len(ids) - 1))]
+    return question_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--seen', type=float, nargs='+',
+                        default=[0, 0.5, 0.9, 0.99])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print('%8s %8s %14s %14s' % ('size', 'seen', 'legacy (ms)', 'pool (ms)'))
+    for size in args.sizes:
+        ids = list(range(1, size + 1))
+        pool = IdPool(ids)
+        for fraction in args.seen:
+            previous = rng.sample(ids, min(size - 1, int(size * fraction)))
+            legacy, _ = timeit(
+                lambda: legacy_draw(ids, previous, rng), args.repeat)
+            sampled, _ = timeit(
+                lambda: pool.sample(previous, 1, rng), args.repeat)
+            print('%8d %8d %14.3f %14.3f' % (
+                size, len(previous), legacy, sampled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+POST /quizzes drawing in the database against the old load-everything
+draw, as the category and the history grow.
+
+The "legacy" column reproduces the old get_random_question(): load the
+whole category with .all(), then retry random indices against the
+previous_questions list. The "random key" column is the endpoint with
+QUIZ_SAMPLING = 'database' after setup-random-keys. Needs postgres; the
+database is emptied and reseeded (the six categories share the rows, so a
+category holds about a sixth of each size).
+
+    python benchmarks/bench_quiz_database.py --database postgresql://.../bench
+'''
+import argparse
+import random
+
+from sqlalchemy import text
+
+from common import make_app, seed, timeit
+from models import Question, db
+from quizrandom import setup_random_keys
+
+
+def legacy_draw(category, previous, rng):
+    selection = Question.query.filter_by(category=category).all()
+    if (len(previous) == len(selection)):
+        return None
+    question = selection[round(rng.random() * (len(selection) - 1))]
+    while (question.id in previous):
+        question = selection[round(rng.random() * (len(selection) - 1))]
+    return question.format()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 600000])
+    parser.add_argument('--seen', type=float, nargs='+',
+                        default=[0, 0.5, 0.99])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    app = make_app(args.database, QUIZ_SAMPLING='database',
+                   RESPONSE_CACHE_SIZE=0)
+    client = app.test_client()
+
+    print('%10s %8s %14s %14s' % (
+        'category', 'seen', 'legacy (ms)', 'random key (ms)'))
+    with app.app_context():
+        setup_random_keys(db.engine)
+        for size in args.sizes:
+            seed(size)
+            db.session.execute(text('ANALYZE questions'))
+            db.session.commit()
+            ids = [row.id for row in db.session.query(
+                Question.id).filter_by(category=1)]
+
+            for fraction in args.seen:
+                previous = rng.sample(
+                    ids, min(len(ids) - 1, int(len(ids) * fraction)))
+                body = {'quiz_category': {'id': 1, 'type': 'Science'},
+                        'previous_questions': previous}
+                legacy, _ = timeit(
+                    lambda: legacy_draw(1, previous, rng),
+                    max(3, args.repeat // 10))
+                keyed, _ = timeit(
+                    lambda: client.post('/quizzes', json=body), args.repeat)
+                print('%10d %8d %14.2f %14.2f' % (
+                    len(ids), len(previous), legacy, keyed))
+
+
+if __name__ == '__main__':
+    main()
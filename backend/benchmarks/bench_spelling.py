@@ -0,0 +1,72 @@
+'''
+Memory and lookup latency of the "did you mean" dictionary.
+
+Builds spelling.SpellingDictionary from a synthetic vocabulary (no
+database needed), reports the memory it holds and the time to correct
+words with one and two typos.
+
+    python benchmarks/bench_spelling.py [--words 10000 50000]
+'''
+import argparse
+import random
+import string
+import time
+import tracemalloc
+
+import common  # noqa: F401 (puts the backend on sys.path)
+from spelling import SpellingDictionary
+
+
+def vocabulary(size, rng):
+    words = set()
+    while (len(words) < size):
+        words.add(''.join(rng.choice(string.ascii_lowercase)
+                          for _ in range(rng.randint(4, 12))))
+    return sorted(words)
+
+
+def misspell(word, typos, rng):
+    for _ in range(typos):
+        position = rng.randrange(len(word))
+        word = word[:position] + rng.choice(
+            string.ascii_lowercase) + word[position + 1:]
+    return word
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--words', type=int, nargs='+',
+                        default=[10000, 50000])
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print('%8s %10s %10s %12s %12s' % (
+        'words', 'build (s)', 'MiB', '1 typo (us)', '2 typos (us)'))
+    for size in args.words:
+        words = vocabulary(size, rng)
+        dictionary = SpellingDictionary()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        dictionary.load_words(words)
+        build = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+
+        latencies = []
+        for typos in (1, 2):
+            queries = [misspell(rng.choice(words), typos, rng)
+                       for _ in range(args.lookups)]
+            start = time.perf_counter()
+            for query in queries:
+                dictionary.lookup(query)
+            latencies.append(
+                (time.perf_counter() - start) / len(queries) * 1e6)
+
+        print('%8d %10.2f %10.1f %12.1f %12.1f' % (
+            size, build, memory, latencies[0], latencies[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''
+Search latency of the ILIKE path against the pg_trgm indexes.
+
+Seeds the bank, times substring search before and after
+`setup_search(trigram=True)`, then times the fuzzy mode on misspelled
+terms. Needs postgres with the pg_trgm extension available; the database
+is emptied and reseeded.
+
+    python benchmarks/bench_trigram.py --database postgresql://.../bench
+'''
+import argparse
+
+from sqlalchemy import text
+
+from common import make_app, seed, timeit
+from models import db
+from search import setup_search
+
+TERMS = ['penicillin', 'versailles', 'discover']
+MISSPELLED = ['penicilin', 'versaill', 'discoverd']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app(args.database, RESPONSE_CACHE_SIZE=0)
+    client = app.test_client()
+
+    def search(term, mode):
+        return lambda: client.post(
+            '/question', json={'searchTerm': term, 'mode': mode,
+                               'per_page': 10, 'after_id': 0})
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            for index in ('questions_question_trgm_idx',
+                          'questions_answer_trgm_idx'):
+                connection.execute(text('DROP INDEX IF EXISTS ' + index))
+        seed(args.size)
+        db.session.execute(text('ANALYZE questions'))
+        db.session.commit()
+
+        print('%d questions, median / p99 in ms' % args.size)
+        for term in TERMS:
+            print('%-12s ILIKE, no index   %8.2f / %8.2f' % (
+                (term,) + timeit(search(term, 'substring'), args.repeat)))
+
+        setup_search(db.engine, fulltext=False, trigram=True)
+        db.session.execute(text('ANALYZE questions'))
+        db.session.commit()
+
+        for term in TERMS:
+            print('%-12s ILIKE, trigram    %8.2f / %8.2f' % (
+                (term,) + timeit(search(term, 'substring'), args.repeat)))
+        for term in MISSPELLED:
+            print('%-12s fuzzy, trigram    %8.2f / %8.2f' % (
+                (term,) + timeit(search(term, 'fuzzy'), args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
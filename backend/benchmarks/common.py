@@ -0,0 +1,85 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app  # noqa: E402
+from models import Question, Category, db  # noqa: E402
+
+CATEGORIES = ['Science', 'Art', 'Geography',
+              'History', 'Entertainment', 'Sports']
+
+WORDS = ['which', 'what', 'who', 'largest', 'river', 'painter', 'palace',
+         'discovered', 'country', 'won', 'world', 'cup', 'team', 'king',
+         'city', 'ocean', 'planet', 'element', 'novel', 'author', 'film',
+         'oscar', 'mountain', 'lake', 'empire', 'battle', 'penicillin',
+         'versailles', 'liver', 'blood', 'scarab', 'egypt', 'africa']
+
+
+'''
+make_app(database)
+    builds the app against database (a SQLAlchemy URL). When database is
+    None a throwaway sqlite file is used, so the benchmarks also run on a
+    machine without postgres.
+'''
+
+
+def make_app(database=None, **config):
+    if database is None:
+        handle, path = tempfile.mkstemp(suffix='.db', prefix='trivia-bench-')
+        os.close(handle)
+        database = 'sqlite:///' + path
+    config['DATABASE_PATH'] = database
+    return create_app(config)
+
+
+'''
+seed(total)
+    empties the questions and categories tables and inserts total random
+    questions spread over the six default categories
+'''
+
+
+def seed(total, seed_value=0):
+    rng = random.Random(seed_value)
+    Question.query.delete()
+    Category.query.delete()
+    db.session.execute(Category.__table__.insert(), [
+        {'id': index + 1, 'type': name}
+        for index, name in enumerate(CATEGORIES)])
+
+    chunk = []
+    for _ in range(total):
+        chunk.append({
+            'question': ' '.join(rng.choice(WORDS) for _ in range(8)) + '?',
+            'answer': ' '.join(rng.choice(WORDS) for _ in range(2)),
+            'category': rng.randint(1, len(CATEGORIES)),
+            'difficulty': rng.randint(1, 5)
+        })
+        if (len(chunk) == 5000):
+            db.session.execute(Question.__table__.insert(), chunk)
+            chunk = []
+    if (chunk):
+        db.session.execute(Question.__table__.insert(), chunk)
+    db.session.commit()
+
+
+'''
+timeit(fn, repeat)
+    runs fn repeat times and returns the median and p99 in milliseconds
+'''
+
+
+def timeit(fn, repeat=50):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    median = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return median, p99
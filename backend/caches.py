@@ -0,0 +1,262 @@
+import collections
+import hashlib
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import changes
+from models import BankRevision, Category, db
+
+'''
+CategoryCache
+    the id -> type map of the categories table, kept in process. Categories
+    almost never change so every read is served from memory; a commit that
+    writes a category drops the map and the next read reloads it.
+'''
+
+
+class CategoryCache:
+
+    def __init__(self):
+        self.categories = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        changes.subscribe(self.on_change)
+
+    def load(self):
+        categories = Category.query.order_by(Category.id).all()
+        self.categories = {
+            category.id: category.type for category in categories}
+        return self.categories
+
+    def all(self):
+        categories = self.categories
+        if (categories is not None):
+            self.hits += 1
+            return categories
+
+        with self.lock:
+            self.misses += 1
+            if (self.categories is None):
+                self.load()
+            return self.categories
+
+    def get(self, category_id):
+        return self.all().get(category_id)
+
+    def subset(self, category_ids):
+        categories = self.all()
+        return {category_id: categories[category_id]
+                for category_id in category_ids
+                if category_id in categories}
+
+    def on_change(self, change_set):
+        if (change_set.categories):
+            self.categories = None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.categories or {})
+        }
+
+
+'''
+BankVersion
+    numbers the committed states of the question bank so read endpoints can
+    hand out strong ETags and answer If-None-Match with 304 Not Modified
+    without touching the questions. Versions are kept per scope:
+        'questions'         any question write
+        'categories'        any category write
+        'category:<id>'     a question write inside that category
+        'reset'             a bulk write, which may touch any category
+    The versions live in the bank_revisions table, bumped by the commit that
+    writes (see bump_revisions), so every worker process hands out the same
+    tag for the same data. Each worker reads them at most every max_age
+    seconds, and again after its own commits: a write through another
+    worker is served stale for at most max_age seconds, like
+    QuestionCounts.
+'''
+
+
+class BankVersion:
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self.versions = None
+        self.loaded_at = 0
+        changes.subscribe(self.on_change)
+
+    def load(self):
+        rows = db.session.query(
+            BankRevision.scope, BankRevision.version).all()
+        self.versions = {scope: version for scope, version in rows}
+        self.loaded_at = time.monotonic()
+        return self.versions
+
+    def current(self):
+        versions = self.versions
+        if (versions is None
+                or time.monotonic() - self.loaded_at > self.max_age):
+            versions = self.load()
+        return versions
+
+    def etag(self, key, *scopes):
+        versions = self.current()
+        state = []
+        for scope in scopes:
+            if (isinstance(scope, tuple)):
+                # a reset may have touched any category
+                state.append('category:%s=%d.%d' % (
+                    scope[1], versions.get('category:%s' % scope[1], 0),
+                    versions.get('reset', 0)))
+            else:
+                state.append('%s=%d' % (scope, versions.get(scope, 0)))
+        return hashlib.sha1(('%s|%s' % (
+            ';'.join(state), key)).encode()).hexdigest()
+
+    def on_change(self, change_set):
+        # this worker's own commits are seen at once
+        self.versions = None
+
+
+def revised_scopes(change_set):
+    touched = set()
+    for question in change_set.added + change_set.deleted:
+        touched.add(question['category'])
+    for before, after in change_set.updated:
+        touched.update((before['category'], after['category']))
+
+    scopes = ['category:%s' % category_id for category_id in touched]
+    if (touched or change_set.reset):
+        scopes.append('questions')
+    if (change_set.reset):
+        scopes.append('reset')
+    if (change_set.categories):
+        scopes.append('categories')
+    return scopes
+
+
+'''
+bump_revisions(connection, change_set)
+    adds one to the version of every scope change_set writes, on connection
+    so it commits or rolls back with the write. Writers that go around the
+    session (see changes.notify) call it in their own transaction.
+'''
+
+BUMP = text(
+    "INSERT INTO bank_revisions (scope, version) VALUES (:scope, 1) "
+    "ON CONFLICT (scope) DO UPDATE "
+    "SET version = bank_revisions.version + 1")
+
+
+def bump_revisions(connection, change_set):
+    scopes = revised_scopes(change_set)
+    if (scopes):
+        connection.execute(BUMP, [{'scope': scope} for scope in scopes])
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_on_commit(session):
+    # the last flush runs after before_commit, so it is forced here to see
+    # every write of the transaction
+    session.flush()
+    change_set = changes.pending(session)
+    if (change_set):
+        bump_revisions(session.connection(), change_set)
+
+
+'''
+ResponseCache
+    rendered JSON bodies of the list and search endpoints, bounded to
+    max_size entries (least recently used first out) and ttl seconds.
+    Keys name what the body was built from, which is what on_change uses to
+    drop exactly the entries a commit made stale:
+        ('questions', path)             any question or category write
+        ('category', id, path)          a write inside category id, or to
+                                        the categories
+        ('search', term, mode, params)  in substring mode a written
+                                        question whose text contains the
+                                        lowercased term, in the other modes
+                                        any question write
+'''
+
+
+class ResponseCache:
+
+    def __init__(self, max_size=256, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        changes.subscribe(self.on_change)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry is None or entry[1] < time.monotonic()):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, body, generation):
+        # generation is self.generation from before the body was built; if
+        # an invalidation ran since then the body may already be stale
+        if (self.max_size <= 0):
+            return
+        with self.lock:
+            if (generation != self.generation):
+                return
+            self.entries[key] = (body, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while (len(self.entries) > self.max_size):
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, stale):
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.entries if stale(key)]:
+                del self.entries[key]
+
+    def on_change(self, change_set):
+        if (change_set.reset or change_set.categories):
+            self.invalidate(lambda key: True)
+            return
+
+        questions = change_set.added + change_set.deleted
+        for before, after in change_set.updated:
+            questions += [before, after]
+        if (not questions):
+            return
+
+        touched = set(question['category'] for question in questions)
+        texts = [(question['question'] or '').lower()
+                 for question in questions]
+
+        def stale(key):
+            if (key[0] == 'category'):
+                return key[1] in touched
+            if (key[0] == 'search' and key[2] == 'substring'):
+                return any(key[1] in text for text in texts)
+            return True
+
+        self.invalidate(stale)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries)
+        }
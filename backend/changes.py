@@ -0,0 +1,148 @@
+import weakref
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import Question, Category
+
+'''
+changes
+    collects the writes of a transaction while it is flushed and hands them
+    to the subscribers (in-process caches) once it commits. Work that is
+    rolled back never reaches them.
+'''
+
+_subscribers = []
+
+
+'''
+ChangeSet
+    what a committed transaction changed. Questions are recorded as
+    format() dicts taken while the rows were still readable:
+        added    questions inserted
+        deleted  questions deleted
+        updated  (before, after) pairs of questions modified
+        reset    questions were changed in a way that cannot be listed
+                 (Query.update() / Query.delete(), bulk loads); subscribers
+                 should rebuild from the database
+        categories  a category was written
+'''
+
+
+class ChangeSet:
+
+    def __init__(self):
+        self.added = []
+        self.deleted = []
+        self.updated = []
+        self.reset = False
+        self.categories = False
+
+    def __bool__(self):
+        return bool(self.added or self.deleted or self.updated
+                    or self.reset or self.categories)
+
+
+'''
+subscribe(callback)
+    calls callback(change_set) after every commit that changed something.
+    Bound methods are held weakly so an app that goes away (tests build one
+    per case) also drops its caches.
+'''
+
+
+def subscribe(callback):
+    if (hasattr(callback, '__self__')):
+        _subscribers.append(weakref.WeakMethod(callback))
+    else:
+        _subscribers.append(weakref.ref(callback))
+
+
+'''
+pending(session)
+    the ChangeSet of the transaction running on session. Code that writes
+    with plain SQL records its changes here so subscribers still see them.
+'''
+
+
+def pending(session):
+    return session.info.setdefault('trivia_changes', ChangeSet())
+
+
+def _previous(question):
+    # format() as it was before the pending modifications
+    state = inspect(question)
+    before = question.format()
+    for key in before:
+        history = state.attrs[key].history
+        if (history.deleted):
+            before[key] = history.deleted[0]
+    return before
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_before(session, flush_context, instances):
+    # deleted rows must be read before their DELETE is emitted
+    for instance in session.deleted:
+        if (isinstance(instance, Question)):
+            pending(session).deleted.append(instance.format())
+        elif (isinstance(instance, Category)):
+            pending(session).categories = True
+
+    for instance in session.dirty:
+        if (isinstance(instance, Question)
+                and session.is_modified(instance)):
+            pending(session).updated.append(
+                (_previous(instance), instance.format()))
+        elif (isinstance(instance, Category)):
+            pending(session).categories = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_after(session, flush_context):
+    # still the pre-flush state, but new rows have their ids by now
+    for instance in session.new:
+        if (isinstance(instance, Question)):
+            pending(session).added.append(instance.format())
+        elif (isinstance(instance, Category)):
+            pending(session).categories = True
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _collect_bulk(update_context):
+    # Query.update() / Query.delete() bypass the unit of work
+    if (update_context.mapper.class_ is Question):
+        pending(update_context.session).reset = True
+    elif (update_context.mapper.class_ is Category):
+        pending(update_context.session).categories = True
+
+
+'''
+notify(change_set)
+    hands change_set to the subscribers. Commits made through the session
+    do this on their own; writers that go around it (COPY, raw connections)
+    call it once their transaction is committed.
+'''
+
+
+def notify(change_set):
+    for reference in list(_subscribers):
+        callback = reference()
+        if (callback is None):
+            if (reference in _subscribers):
+                _subscribers.remove(reference)
+        else:
+            callback(change_set)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    change_set = session.info.pop('trivia_changes', None)
+    if (change_set):
+        notify(change_set)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop('trivia_changes', None)
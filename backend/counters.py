@@ -0,0 +1,105 @@
+import threading
+import time
+
+from sqlalchemy import func, text
+
+import changes
+from models import Question, db
+
+'''
+QuestionCounts
+    the number of questions in the bank and in each category, kept in
+    process so list, post and delete responses report totals without
+    counting rows. The counts are loaded once, moved by every committed
+    insert, delete or category change, and reloaded after max_age seconds
+    to pick up writes made by other worker processes.
+
+    approximate=True loads them from the planner statistics instead
+    (pg_class.reltuples and the most common values of questions.category),
+    which avoids the full count on very large banks. It falls back to the
+    exact count on databases other than postgres, or when the table was
+    never analyzed.
+'''
+
+
+class QuestionCounts:
+
+    def __init__(self, approximate=False, max_age=60):
+        self.approximate = approximate
+        self.max_age = max_age
+        self.by_category = None
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+        changes.subscribe(self.on_change)
+
+    def load(self):
+        counts = None
+        if (self.approximate and db.engine.dialect.name == 'postgresql'):
+            counts = self.estimate()
+        if (counts is None):
+            rows = db.session.query(
+                Question.category, func.count(Question.id)).group_by(
+                Question.category).all()
+            counts = {category: count for category, count in rows}
+
+        with self.lock:
+            self.by_category = counts
+            self.loaded_at = time.monotonic()
+        return counts
+
+    def estimate(self):
+        total = db.session.execute(text(
+            "SELECT reltuples FROM pg_class "
+            "WHERE oid = 'questions'::regclass")).scalar()
+        row = db.session.execute(text(
+            "SELECT most_common_vals::text::int[], most_common_freqs "
+            "FROM pg_stats "
+            "WHERE tablename = 'questions' AND attname = 'category'")).first()
+        if (not total or total < 0 or row is None):
+            return None
+
+        values, frequencies = row
+        return {category: int(round(total * frequency))
+                for category, frequency in zip(values, frequencies)}
+
+    def counts(self):
+        counts = self.by_category
+        if (counts is None
+                or time.monotonic() - self.loaded_at > self.max_age):
+            counts = self.load()
+        return counts
+
+    def total(self):
+        return sum(self.counts().values())
+
+    def in_category(self, category_id):
+        return self.counts().get(category_id, 0)
+
+    def move(self, category_id, delta):
+        counts = self.by_category
+        counts[category_id] = max(0, counts.get(category_id, 0) + delta)
+
+    def on_change(self, change_set):
+        with self.lock:
+            if (self.by_category is None):
+                return
+            if (change_set.reset):
+                self.by_category = None
+                return
+
+            for question in change_set.added:
+                self.move(question['category'], 1)
+            for question in change_set.deleted:
+                self.move(question['category'], -1)
+            for before, after in change_set.updated:
+                if (before['category'] != after['category']):
+                    self.move(before['category'], -1)
+                    self.move(after['category'], 1)
+
+    def stats(self):
+        return {
+            'approximate': self.approximate,
+            'total': sum((self.by_category or {}).values()),
+            'age': round(time.monotonic() - self.loaded_at, 3)
+            if self.by_category is not None else None
+        }
@@ -1,31 +1,353 @@
 import os
-from flask import Flask, request, abort, jsonify
+import atexit
+import base64
+import binascii
+import bisect
+import collections
+import functools
+import io
+import json
+from flask import (
+    Flask, request, abort, jsonify, make_response, current_app)
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category, db
+import click
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+
+from models import setup_db, Question, db, database_path
+from caches import CategoryCache, BankVersion, ResponseCache
+from counters import QuestionCounts
+from mutations import apply_batch
+from search import (
+    build_search, headlines, setup_search, facet_rows, facets)
+from textindex import InvertedIndex, PrefixIndex
+from spelling import SpellingDictionary
+from quizpool import QuestionPools
+from quizsessions import MemorySessionStore, SqlSessionStore
+from quizrandom import random_rows, setup_random_keys
+import seenset
+from grading import AnswerKeys
+from transfer import (
+    export_questions, import_questions, EXPORT_FORMATS, IMPORT_FORMATS)
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTIONS_PER_PAGE = 100
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+
+def request_arg(request, name, type=None):
+    # query string first, then the JSON body for POST endpoints like search
+
+    value = request.args.get(name, type=type)
+    if (value is None and request.is_json):
+        body = request.get_json(silent=True) or {}
+        value = body.get(name)
+        if (value is not None and type is not None):
+            try:
+                value = type(value)
+            except (TypeError, ValueError):
+                abort(422)
+    return value
+
+
+def encode_cursor(value, kind='id'):
+    # 'id' cursors hold the last id of a page, 'off' cursors the offset of
+    # the next page of a ranked result
+
+    return base64.urlsafe_b64encode(
+        ('%s:%d' % (kind, value)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, kind='id'):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_kind, value = base64.urlsafe_b64decode(
+            padded.encode()).decode().split(':')
+        if (cursor_kind != kind):
+            raise ValueError(cursor_kind)
+        return int(value)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(422)
+
+
+def list_arg(request, name):
+    # ?name=a,b in the query string, or a list / comma string in the body
+
+    value = request_arg(request, name)
+    if (value is None):
+        return None
+    if (isinstance(value, str)):
+        value = value.split(',')
+    if (not isinstance(value, list)):
+        abort(422)
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def int_list_arg(request, name):
+    # list_arg() of integers; a single number is accepted as well
+
+    value = request_arg(request, name)
+    if (value is None):
+        return None
+    if (isinstance(value, int) and not isinstance(value, bool)):
+        return [value]
+    try:
+        return [int(item) for item in list_arg(request, name)]
+    except ValueError:
+        abort(422)
+
+
+def quiz_categories(data):
+    # the categories a quiz draws from, and the current_category to echo:
+    # quiz_categories lists them, quiz_category {id: 0} is ALL (as the
+    # frontend sends it, ids may come as strings). None stands for all.
+
+    categories = data.get('quiz_categories')
+    try:
+        if (categories is not None):
+            categories = [int(category) for category in categories]
+            return categories, categories
+        category_id = int(data['quiz_category']['id'])
+    except (KeyError, TypeError, ValueError):
+        abort(422)
+    if (category_id == 0):
+        return None, 0
+    return [category_id], category_id
+
+
+def quiz_weights(data):
+    # optional {category id: weight} shares of a multi-category quiz
+
+    weights = data.get('weights')
+    if (weights is None):
+        return None
+    try:
+        weights = {int(category): float(weight)
+                   for category, weight in weights.items()}
+    except (AttributeError, TypeError, ValueError):
+        abort(422)
+    if (any(weight < 0 for weight in weights.values())):
+        abort(422)
+    return weights
+
+
+def quiz_difficulty(data, step):
+    # the difficulty target of an adaptive quiz, or None: difficulty is the
+    # target of the previous draw (the response hands it back), correct
+    # whether the last answer was right, which moves it a step up or down.
+    # Kept within 1 to 5, on multiples of a half so the draws share tables.
+
+    target = data.get('difficulty')
+    if (target is None):
+        return None
+    if (isinstance(target, bool) or not isinstance(target, (int, float))):
+        abort(422)
+    correct = data.get('correct')
+    if (correct is True):
+        target += step
+    elif (correct is False):
+        target -= step
+    elif (correct is not None):
+        abort(422)
+    return min(5, max(1, round(target * 2) / 2))
+
+
+def question_fields(request):
+    # ?fields=question,answer narrows the questions to those keys; the id
+    # is always returned since cursors and the client rely on it
+
+    fields = list_arg(request, 'fields')
+    if (fields is None):
+        return QUESTION_FIELDS
+    if (any(field not in QUESTION_FIELDS for field in fields)):
+        abort(422)
+    return tuple(field for field in QUESTION_FIELDS
+                 if field == 'id' or field in fields)
+
+
+def includes(request, block):
+    # ?include= lists the optional blocks of the response, all by default
+
+    blocks = list_arg(request, 'include')
+    return blocks is None or block in blocks
+
+
+def load_columns(fields, with_categories):
+    # the columns the SELECT needs: the requested fields, plus the category
+    # when the categories block is built from the page
+
+    columns = set(fields)
+    if (with_categories):
+        columns.add('category')
+    return [getattr(Question, column) for column in QUESTION_FIELDS
+            if column in columns]
+
+
+def per_page(request):
+    count = request_arg(request, 'per_page', type=int)
+    if (count is None):
+        return QUESTIONS_PER_PAGE
+    if (count < 1):
+        abort(422)
+    return min(count, current_app.config.get(
+        'MAX_QUESTIONS_PER_PAGE', MAX_QUESTIONS_PER_PAGE))
+
+
+def paginate_questions(request, selection, columns=None, ranked=False):
+    # only the requested page is loaded: the ordering on the primary key
+    # lets the database walk questions_pkey and stop after LIMIT rows, and
+    # only columns are selected (all of them by default).
+    #
+    # ?page=N skips (N - 1) pages with OFFSET. ?cursor= (the opaque
+    # next_cursor of a previous response) or ?after_id= switch to keyset
+    # pagination, WHERE id > last_id, which costs the same on every page.
+    # ?per_page= sets the page size, capped at MAX_QUESTIONS_PER_PAGE.
+    # One extra row is fetched to know whether a next page exists.
+    #
+    # A ranked selection is already ordered by relevance; the id only
+    # breaks ties, so its cursors carry an offset instead.
+    #
+    # Returns the page as Question objects and the next cursor.
+
+    selection = selection.order_by(Question.id)
+    if (columns is not None):
+        selection = selection.options(load_only(*columns))
+    cursor = request_arg(request, 'cursor')
+    after_id = request_arg(request, 'after_id', type=int)
+    limit = per_page(request)
+    offset = None
 
+    if (ranked and after_id is not None):
+        abort(422)
+    elif (ranked and cursor is not None):
+        offset = decode_cursor(cursor, 'off')
+    elif (cursor is not None):
+        selection = selection.filter(Question.id > decode_cursor(cursor))
+    elif (after_id is not None):
+        selection = selection.filter(Question.id > after_id)
+    else:
+        page = request_arg(request, 'page', type=int)
+        if (page is None):
+            page = 1
+        if (page < 1):
+            return [], None
+        offset = (page - 1) * limit
 
-def paginate_questions(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
+    if (offset):
+        selection = selection.offset(offset)
+    questions = selection.limit(limit + 1).all()
+    next_cursor = None
+    if (len(questions) > limit):
+        questions = questions[:limit]
+        if (ranked):
+            next_cursor = encode_cursor((offset or 0) + limit, 'off')
+        else:
+            next_cursor = encode_cursor(questions[-1].id)
+
+    return questions, next_cursor
+
+
+def paginate_ids(request, ids):
+    # paginate_questions() over a sorted list of ids already in memory,
+    # same parameters and cursors
+
+    cursor = request_arg(request, 'cursor')
+    after_id = request_arg(request, 'after_id', type=int)
+    limit = per_page(request)
+
+    if (cursor is not None):
+        start = bisect.bisect_right(ids, decode_cursor(cursor))
+    elif (after_id is not None):
+        start = bisect.bisect_right(ids, after_id)
+    else:
+        page = request_arg(request, 'page', type=int)
+        if (page is None):
+            page = 1
+        if (page < 1):
+            return [], None
+        start = (page - 1) * limit
+
+    page_ids = list(ids[start:start + limit])
+    next_cursor = None
+    if (start + limit < len(ids)):
+        next_cursor = encode_cursor(page_ids[-1])
+    return page_ids, next_cursor
+
+
+def count_questions(selection, limit=None):
+    # SELECT count(id) on the filtered table, without wrapping the whole
+    # selection in a subquery like Query.count() does. With a limit the
+    # count stops after limit + 1 rows and returns (count, exact), where
+    # exact is False when the real count is larger than limit.
+
+    selection = selection.order_by(None)
+    if (limit is None):
+        return selection.with_entities(func.count(Question.id)).scalar()
 
-    questions = [question.format() for question in selection]
-    paginated_questions = questions[start:end]
-    return paginated_questions
+    bounded = selection.with_entities(Question.id).limit(limit + 1).subquery()
+    count = db.session.query(func.count()).select_from(bounded).scalar()
+    return min(count, limit), count <= limit
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(test_config or {})
+    setup_db(app, app.config.get('DATABASE_PATH', database_path))
     CORS(app)
     cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+    category_cache = CategoryCache()
+    question_counts = QuestionCounts(
+        approximate=app.config.get('APPROXIMATE_COUNTS', False),
+        max_age=app.config.get('COUNTS_MAX_AGE', 60))
+
+    bank_version = BankVersion(
+        max_age=app.config.get('ETAG_MAX_AGE', 60))
+    search_index = InvertedIndex(app.config.get('SEARCH_INDEX_PATH'))
+    prefix_index = PrefixIndex()
+    question_pools = QuestionPools(
+        spread=app.config.get('QUIZ_DIFFICULTY_SPREAD', 0.5),
+        max_age=app.config.get('QUIZ_POOL_MAX_AGE', 60))
+    answer_keys = AnswerKeys(
+        aliases=app.config.get('ANSWER_ALIASES'),
+        max_distance=app.config.get('GRADE_MAX_DISTANCE', 2),
+        max_age=app.config.get('GRADE_MAX_AGE', 60))
+    if (app.config.get('QUIZ_SESSION_STORE', 'memory') == 'sql'):
+        quiz_sessions = SqlSessionStore(
+            ttl=app.config.get('QUIZ_SESSION_TTL', 3600))
+    else:
+        quiz_sessions = MemorySessionStore(
+            max_size=app.config.get('QUIZ_SESSION_SIZE', 1024),
+            ttl=app.config.get('QUIZ_SESSION_TTL', 3600))
+    spelling = SpellingDictionary(
+        max_distance=app.config.get('SPELLING_MAX_DISTANCE', 2))
+    response_cache = ResponseCache(
+        max_size=app.config.get('RESPONSE_CACHE_SIZE', 256),
+        ttl=app.config.get('RESPONSE_CACHE_TTL', 30))
+
+    @app.before_first_request
+    def warm_caches():
+        category_cache.load()
+        question_counts.load()
+        # built up front, not by the first autocomplete keystroke or the
+        # first search that finds nothing
+        prefix_index.ensure()
+        spelling.ensure()
+        if (app.config.get('SEARCH_INDEX', False)):
+            search_index.ensure()
+
+    # the index snapshot is written back on exit so the next start can load
+    # it instead of rebuilding, unless a write was applied to the index
+    # since it was built or loaded (see InvertedIndex)
+    if (search_index.path is not None):
+        def save_search_index():
+            with app.app_context():
+                search_index.save()
+        atexit.register(save_search_index)
+
     @app.after_request
     def after_request(response):
         response.headers.add(
@@ -36,6 +358,62 @@ def create_app(test_config=None):
             'GET, PATCH, POST, DELETE, OPTIONS')
         return response
 
+    # answers If-None-Match with 304 while the scopes the view reads from
+    # have not been written ('category' stands for the category_id of the
+    # route, see BankVersion). The tag is computed before the view runs, so
+    # a write racing with the request can only make the next poll miss.
+
+    def conditional(*scopes):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                view_scopes = [
+                    (scope, kwargs[scope + '_id'])
+                    if scope == 'category' else scope
+                    for scope in scopes]
+                etag = bank_version.etag(request.full_path, *view_scopes)
+                if (request.if_none_match.contains(etag)):
+                    response = app.response_class(status=304)
+                    response.set_etag(etag)
+                    return response
+
+                response = make_response(view(*args, **kwargs))
+                if (response.status_code == 200):
+                    response.set_etag(etag)
+                return response
+            return wrapper
+        return decorator
+
+    # serves the rendered body from response_cache when key(**kwargs)
+    # names an entry, see ResponseCache for the key shapes
+
+    def cached(key):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                cache_key = key(**kwargs)
+                body = response_cache.get(cache_key)
+                if (body is not None):
+                    return app.response_class(
+                        body, mimetype='application/json')
+
+                generation = response_cache.generation
+                response = make_response(view(*args, **kwargs))
+                if (response.status_code == 200):
+                    response_cache.set(
+                        cache_key, response.get_data(), generation)
+                return response
+            return wrapper
+        return decorator
+
+    def search_key():
+        search = dict(request.get_json(silent=True) or {})
+        term = str(search.pop('searchTerm', '')).lower()
+        mode = search.pop('mode', app.config.get('SEARCH_MODE', 'substring'))
+        params = json.dumps([search, sorted(request.args.items())],
+                            sort_keys=True)
+        return ('search', term, mode, params)
+
     # ======================= #
     #       ENDPOINTS         #
     # ======================= #
@@ -43,34 +421,67 @@ def create_app(test_config=None):
     # GET QUESTIONS
 
     @app.route('/questions')
+    @conditional('questions', 'categories')
+    @cached(lambda: ('questions', request.full_path))
     def get_questions():
-        categories = {}
-        selection = Question.query.all()
-        current_questions = paginate_questions(request, selection)
-
-        if (len(current_questions) != 0):
-            for question in current_questions:
-                category_key = question['category']
-                category_value = Category.query.get(category_key)
-                categories[category_key] = category_value.type
-                categories_list = dict(categories)
-        elif (len(current_questions) == 0):
+        fields = question_fields(request)
+        with_categories = includes(request, 'categories')
+        selection = Question.query
+        page, next_cursor = paginate_questions(
+            request, selection, load_columns(fields, with_categories))
+        current_questions = [question.format(fields) for question in page]
+
+        if (len(current_questions) == 0):
             abort(404)
 
-        return jsonify({
+        body = {
             "success": True,
             "questions": current_questions,
-            "total_questions": len(selection),
+            "total_questions": question_counts.total(),
             "current_category": None,
-            "categories": categories_list
-        })
+            "next_cursor": next_cursor
+        }
+        if (with_categories):
+            body["categories"] = category_cache.subset(
+                question.category for question in page)
+        return jsonify(body)
+
+    # EXPORT QUESTIONS
+
+    @app.route('/questions/export')
+    def get_questions_export():
+        export_format = request.args.get('format', 'ndjson')
+        if (export_format not in EXPORT_FORMATS):
+            abort(422)
+
+        writer, mimetype = EXPORT_FORMATS[export_format]
+        rows = export_questions(db.engine)
+        return app.response_class(
+            writer(rows), mimetype=mimetype, headers={
+                'Content-Disposition':
+                    'attachment; filename=questions.' + export_format})
+
+    # IMPORT QUESTIONS
+
+    @app.route('/questions/import', methods=['POST'])
+    def post_questions_import():
+        import_format = request.args.get('format', 'ndjson')
+        if (import_format not in IMPORT_FORMATS):
+            abort(422)
+
+        # the body is parsed line by line as it is read
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8')
+        report = import_questions(
+            db.engine, IMPORT_FORMATS[import_format](lines),
+            chunk_size=app.config.get('IMPORT_CHUNK_SIZE', 5000))
+
+        return jsonify(dict(report.format(), success=True))
 
     # DELETE QUESTIONS
 
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
         question_to_delete = Question.query.get(question_id)
-        total_questions = Question.query.all()
 
         if (question_to_delete):
             try:
@@ -83,7 +494,7 @@ def create_app(test_config=None):
         else:
             abort(404)
 
-        total_questions = len(Question.query.all())
+        total_questions = question_counts.total()
 
         return jsonify({
             "success": True,
@@ -91,23 +502,68 @@ def create_app(test_config=None):
             "total_questions": total_questions
         })
 
+    # BATCH DELETE / REASSIGN QUESTIONS
+
+    @app.route('/questions/batch', methods=['POST'])
+    def post_questions_batch():
+        res = request.get_json(silent=True) or {}
+        try:
+            deletes = [int(question_id)
+                       for question_id in res.get('delete', [])]
+            reassignments = [
+                {'id': int(item['id']), 'category': int(item['category'])}
+                for item in res.get('reassign', [])]
+        except (KeyError, TypeError, ValueError):
+            abort(422)
+
+        reassigned_ids = [item['id'] for item in reassignments]
+        if (len(set(deletes)) != len(deletes)
+                or len(set(reassigned_ids)) != len(reassigned_ids)
+                or len(deletes) + len(reassignments) > app.config.get(
+                    'MAX_BATCH_SIZE', 10000)):
+            abort(422)
+
+        try:
+            touched, deleted, results = apply_batch(
+                db.session, deletes, reassignments, category_cache.all())
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            abort(500)
+
+        return jsonify({
+            "success": True,
+            "results": results,
+            "deleted": deleted,
+            "reassigned": sum(1 for result in results
+                              if result['outcome'] == 'reassigned'),
+            "total_questions": question_counts.total(),
+            "category_totals": {
+                category_id: question_counts.in_category(category_id)
+                for category_id in touched}
+        })
+
     # POST QUESTION
 
     @app.route('/questions', methods=['POST'])
     def post_question():
         res = request.get_json()
-        print('RES: ', res)
-        new_question = Question(
-            question=res['question'],
-            answer=res['answer'],
-            difficulty=res['difficulty'],
-            category=res['category']
-        )
+
+        # the form posts its select values as strings
+        try:
+            new_question = Question(
+                question=res['question'],
+                answer=res['answer'],
+                difficulty=int(res['difficulty']),
+                category=int(res['category'])
+            )
+        except (KeyError, TypeError, ValueError):
+            abort(422)
 
         try:
             db.session.add(new_question)
             db.session.commit()
-            total_questions = Question.query.count()
+            total_questions = question_counts.total()
         except BaseException:
             db.session.rollback()
             abort(500)
@@ -120,10 +576,10 @@ def create_app(test_config=None):
         # GET CATEGORIES
 
     @app.route('/categories')
+    @conditional('categories')
     def get_categories():
-        categories = Category.query.all()
-        cat_dic = {cat.id: cat.type for cat in categories}
-        total_categories = len(categories)
+        cat_dic = category_cache.all()
+        total_categories = len(cat_dic)
         return jsonify({
             'success': True,
             'categories': cat_dic,
@@ -133,91 +589,436 @@ def create_app(test_config=None):
         # SEARCH QUESTION
 
     @app.route('/question', methods=['POST'])
+    @cached(search_key)
     def search_questions():
         search = request.get_json()
+        term = search['searchTerm']
+
+        # mode: substring (ILIKE on the question, the default), fulltext
+        # (ranked tsvector match on question and answer) or fuzzy (trigram
+        # word similarity, tolerates typos); the last two need postgres.
+        # index answers from the in-memory inverted index on any database:
+        # every word of the term must start a word of the question or answer
+        mode = search.get('mode', app.config.get('SEARCH_MODE', 'substring'))
+        options = {}
+        if ('threshold' in search):
+            try:
+                options['threshold'] = float(search['threshold'])
+            except (TypeError, ValueError):
+                abort(422)
+            if (not 0 <= options['threshold'] <= 1):
+                abort(422)
 
-        query_search_string = '%' + search['searchTerm'] + '%'
-        selection = Question.query.filter(
-            Question.question.ilike(query_search_string)).all()
-        questions = [question.format() for question in selection]
+        fields = question_fields(request)
+        columns = load_columns(fields, False)
+
+        # category and difficulty (a number or a list) narrow the results;
+        # with include=facets the matches are also counted per category and
+        # per difficulty (one more GROUP BY, so only on request)
+        categories = int_list_arg(request, 'category')
+        difficulties = int_list_arg(request, 'difficulty')
+        with_facets = 'facets' in (list_arg(request, 'include') or [])
+        search_facets = None
+
+        # results come one page at a time, like the listings (per_page is
+        # capped the same way). With facets the total is exact; without,
+        # it stops counting at SEARCH_COUNT_LIMIT matches and total_exact
+        # tells when it did
+        if (mode == 'index'):
+            ids = search_index.search(term)
+            attributes = search_index.attributes
+            if (with_facets):
+                rows = collections.Counter(
+                    attributes[question_id] for question_id in ids)
+                search_facets, _ = facets(
+                    [key + (count,) for key, count in rows.items()],
+                    categories, difficulties)
+            if (categories is not None or difficulties is not None):
+                ids = [question_id for question_id in ids
+                       if (categories is None
+                           or attributes[question_id][0] in categories)
+                       and (difficulties is None
+                            or attributes[question_id][1] in difficulties)]
+            total_questions, total_exact = len(ids), True
+            page_ids, next_cursor = paginate_ids(request, ids)
+            page = []
+            if (page_ids):
+                page = Question.query.filter(
+                    Question.id.in_(page_ids)).order_by(
+                    Question.id).options(load_only(*columns)).all()
+        else:
+            built = build_search(mode, term, options)
+            if (built is None):
+                abort(422)
+            selection, ranked = built
+            if (with_facets):
+                search_facets, total_questions = facets(
+                    facet_rows(selection), categories, difficulties)
+                total_exact = True
+
+            if (categories is not None):
+                selection = selection.filter(
+                    Question.category.in_(categories))
+            if (difficulties is not None):
+                selection = selection.filter(
+                    Question.difficulty.in_(difficulties))
+
+            page, next_cursor = paginate_questions(
+                request, selection, columns, ranked)
+            if (not with_facets):
+                total_questions, total_exact = count_questions(
+                    selection, app.config.get('SEARCH_COUNT_LIMIT', 10000))
+        questions = [question.format(fields) for question in page]
+
+        if (mode == 'fulltext' and search.get('highlight')):
+            snippets = headlines([question.id for question in page], term)
+            for question in questions:
+                question['headline'] = snippets.get(question['id'])
 
         if (questions):
-            return jsonify({
+            body = {
                 'success': True,
                 'questions': questions,
                 'current_category': None,
-                'total_questions': len(questions)
-            })
-        else:
+                'total_questions': total_questions,
+                'total_exact': total_exact,
+                'next_cursor': next_cursor
+            }
+            if (with_facets):
+                body['facets'] = search_facets
+            return jsonify(body)
+
+        # nothing found: offer a correction built from the bank's words
+        suggestion = spelling.suggest(term)
+        if (suggestion is None):
             abort(404)
+        return jsonify({
+            "success": False,
+            "error": 404,
+            "message": "Resource not found",
+            "did_you_mean": suggestion
+        })
+
+        # AUTOCOMPLETE
+
+    @app.route('/questions/autocomplete')
+    def get_autocomplete():
+        prefix = request.args.get('q', '')
+        limit = request.args.get('limit', 8, type=int)
+        if (limit < 1):
+            abort(422)
+        limit = min(limit, app.config.get('MAX_AUTOCOMPLETE', 50))
+
+        # served from memory, no SQL once the prefix index is built
+        questions, answers = prefix_index.complete(prefix, limit)
+        return jsonify({
+            'success': True,
+            'questions': questions,
+            'answers': answers
+        })
 
         # Get question by category
 
     @app.route('/categories/<int:category_id>/questions')
+    @conditional('category', 'categories')
+    @cached(lambda category_id: (
+        'category', category_id, request.full_path))
     def get_questions_by_category(category_id):
-        categories = {}
-        selection = Question.query.filter_by(category=category_id).all()
-        current_questions = paginate_questions(request, selection)
-        print("current questions: ", current_questions)
-
-        if (len(current_questions) != 0):
-            for question in current_questions:
-                category_key = question['category']
-                category_value = Category.query.get(category_key)
-                categories[category_key] = category_value.type
-                categories_list = dict(categories)
-        elif (len(current_questions) == 0):
+        category = category_cache.get(category_id)
+        if (category is None):
             abort(404)
 
-        print()
+        fields = question_fields(request)
+        with_categories = includes(request, 'categories')
+        selection = Question.query.filter_by(category=category_id)
+        page, next_cursor = paginate_questions(
+            request, selection, load_columns(fields, with_categories))
+        current_questions = [question.format(fields) for question in page]
 
-        category = Category.query.get(category_id).type
+        if (len(current_questions) == 0):
+            abort(404)
 
-        return jsonify({
+        body = {
             "success": True,
             "questions": current_questions,
-            "total_questions": len(current_questions),
+            "total_questions": question_counts.in_category(category_id),
             "current_category": category,
-            "categories": categories
-        })
+            "next_cursor": next_cursor
+        }
+        if (with_categories):
+            body["categories"] = category_cache.subset(
+                question.category for question in page)
+        return jsonify(body)
+
+    def database_sampling():
+        return app.config.get('QUIZ_SAMPLING', 'pool') == 'database'
+
+    def seen_signer():
+        return seenset.signer(app.config.get('SECRET_KEY'))
+
+    def quiz_seen(token, previous):
+        # the decoded token plus the previous ids; an id of QUIZ_SEEN_LIMIT
+        # or more is refused, it would size the bitmap
+        limit = app.config.get('QUIZ_SEEN_LIMIT', 1 << 24)
+        try:
+            seen = seenset.decode(token, seen_signer(), limit)
+        except ValueError:
+            abort(422)
+        for question_id in previous:
+            if (not isinstance(question_id, int) or question_id < 0):
+                continue
+            if (question_id >= limit):
+                abort(422)
+            seen.add(question_id)
+        return seen
+
+    # draws count questions from the id pools and loads them. An id whose
+    # row is gone (deleted through another worker since the pools were
+    # built) is discarded from the pools and drawn again.
+
+    def pooled_questions(categories, seen, count, target, weights):
+        questions = []
+        while (len(questions) < count):
+            if (target is None):
+                drawn = question_pools.sample(
+                    categories, seen, count - len(questions), weights)
+            else:
+                drawn = question_pools.sample_difficulty(
+                    categories, seen, count - len(questions), target,
+                    weights)
+            if (not drawn):
+                break
+
+            loaded = {question.id: question for question in
+                      Question.query.filter(Question.id.in_(drawn)).all()}
+            for question_id in drawn:
+                if (question_id in loaded):
+                    questions.append(loaded[question_id].format())
+                else:
+                    question_pools.discard(question_id)
+            if (len(loaded) == len(drawn)):
+                break
+            seen = set(seen).union(loaded)
+        return questions
 
         # Get random question
 
     @app.route('/quizzes', methods=['POST'])
     def get_random_question():
         data = request.get_json()
-        category_id = data['quiz_category']['id']
-        prev_questions = data['previous_questions']
+        categories, category_id = quiz_categories(data)
+        prev_questions = data.get('previous_questions', [])
+
+        # seen is the compact alternative to previous_questions (see
+        # seenset): a token the response hands back updated with the
+        # questions drawn, signed when SECRET_KEY is set. The two may be
+        # combined.
+        seen = None
+        if ('seen' in data):
+            seen = quiz_seen(data['seen'], prev_questions)
+            prev_questions = seen
 
-        selection = Question.query.filter_by(category=category_id).all()
+        # count (1 by default, at most MAX_QUIZ_COUNT) distinct questions
+        # are drawn in one pass from the in-memory id pools of the
+        # categories (all of them for ALL), among the ids not in
+        # prev_questions; only those rows are loaded
+
+        count = data.get('count', 1)
+        if (not isinstance(count, int) or count < 1):
+            abort(422)
+        count = min(count, app.config.get('MAX_QUIZ_COUNT', 50))
+
+        # a difficulty target leans the draw toward that difficulty (see
+        # QuestionPools.sample_difficulty)
+        target = quiz_difficulty(
+            data, app.config.get('QUIZ_DIFFICULTY_STEP', 0.5))
+
+        # with QUIZ_SAMPLING = 'database' the rows are drawn by the
+        # database instead (see quizrandom), for banks too large to pool
+        # in every worker; weights and difficulty targets need the pools
+        if (database_sampling()):
+            if (data.get('weights') is not None or target is not None):
+                abort(422)
+            questions = [dict(row) for row in random_rows(
+                categories, prev_questions, count)]
+        else:
+            questions = pooled_questions(
+                categories, prev_questions, count, target,
+                quiz_weights(data))
 
         # in case there aren't any questions remaining return question: False
         # to trigger forceEnd: true in frontend
 
-        def random_question():
-            max = len(selection)
-            random_index = round((random.random() * (max - 1)))
-            return selection[random_index]
+        body = {
+            'success': True,
+            'question': questions[0] if questions else False,
+            'questions': questions,
+            'current_category': category_id
+        }
+        if (target is not None):
+            body['difficulty'] = target
+        if (seen is not None):
+            for question in questions:
+                seen.add(question['id'])
+            body['seen'] = seenset.encode(seen, seen_signer())
+        return jsonify(body)
+
+    # Grade an answer
 
-        if (len(prev_questions) == len(selection)):
-            return jsonify({
-                'success': True,
-                'question': False,
-                'current_category': category_id
-            })
+    # the guess is judged against answer keys normalized when the question
+    # was written (see grading), forgiving small typos
+
+    @app.route('/questions/<int:question_id>/answer', methods=['POST'])
+    def grade_answer(question_id):
+        data = request.get_json() or {}
+        guess = data.get('answer')
+        if (not isinstance(guess, str)):
+            abort(422)
+
+        graded = answer_keys.grade(question_id, guess)
+        if (graded is None):
+            abort(404)
+        correct, exact, answer = graded
 
+        return jsonify({
+            'success': True,
+            'correct': correct,
+            'exact': exact,
+            'answer': answer
+        })
+
+    # QUIZ SESSIONS
+
+    # a session deals the deck once: a shuffled draw from the ids of the
+    # categories, kept by the server. Each "next"
+    # takes one card, so the client no longer sends previous_questions.
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def start_quiz_session():
+        data = request.get_json() or {}
+        categories, category_id = quiz_categories(data)
+        # the deck holds "questions" cards (QUIZ_DECK_SIZE by default),
+        # capped at MAX_QUIZ_DECK_SIZE however large the categories are
+        count = data.get('questions', app.config.get('QUIZ_DECK_SIZE', 20))
+        if (not isinstance(count, int) or count < 1):
+            abort(422)
+        count = min(count, app.config.get('MAX_QUIZ_DECK_SIZE', 100))
+
+        if (database_sampling()):
+            if (data.get('weights') is not None):
+                abort(422)
+            deck = [row.id for row in random_rows(
+                categories, [], count, [Question.id])]
         else:
+            deck = question_pools.sample(
+                categories, [], count, quiz_weights(data))
+        session_id = quiz_sessions.create(category_id, deck)
 
-            question = random_question()
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'current_category': category_id,
+            'total_questions': len(deck)
+        })
 
-            while(question.id in prev_questions):
-                question = random_question()
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        # cards of questions deleted since the deal are skipped
+        while (True):
+            try:
+                question_id, remaining = quiz_sessions.draw(session_id)
+            except KeyError:
+                abort(404)
+            if (question_id is None):
+                question = None
+                break
+            question = Question.query.get(question_id)
+            if (question is not None):
+                break
 
-            return jsonify({
-                'success': True,
-                'question': question.format(),
-                'current_category': category_id
-            })
+        return jsonify({
+            'success': True,
+            'question': question.format() if question else False,
+            'remaining': remaining
+        })
+
+    # CACHE STATISTICS
+
+    @app.route('/stats')
+    def get_stats():
+        return jsonify({
+            'success': True,
+            'category_cache': category_cache.stats(),
+            'question_counts': question_counts.stats(),
+            'response_cache': response_cache.stats(),
+            'search_index': search_index.stats(),
+            'prefix_index': prefix_index.stats(),
+            'spelling': spelling.stats(),
+            'question_pools': question_pools.stats(),
+            'quiz_sessions': quiz_sessions.stats(),
+            'answer_keys': answer_keys.stats()
+        })
+
+    # ======================= #
+    #     CLI COMMANDS        #
+    # ======================= #
+
+    @app.cli.command('export-questions')
+    @click.option('--format', 'export_format', default='ndjson',
+                  type=click.Choice(sorted(EXPORT_FORMATS)))
+    @click.option('--output', type=click.File('w'), default='-')
+    def export_questions_command(export_format, output):
+        """Stream every question, with its category name, to a file."""
+        writer, mimetype = EXPORT_FORMATS[export_format]
+        for chunk in writer(export_questions(db.engine)):
+            output.write(chunk)
+
+    @app.cli.command('setup-search')
+    @click.option('--fulltext/--no-fulltext', default=True)
+    @click.option('--trigram/--no-trigram', default=True)
+    def setup_search_command(fulltext, trigram):
+        """Add the full-text and trigram search indexes (postgres)."""
+        setup_search(db.engine, fulltext=fulltext, trigram=trigram)
+        click.echo('search indexes are in place')
+
+    @app.cli.command('setup-random-keys')
+    def setup_random_keys_command():
+        """Add the indexed random key quizzes draw from (postgres)."""
+        setup_random_keys(db.engine)
+        click.echo('random keys are in place')
+
+    @app.cli.command('build-search-index')
+    def build_search_index_command():
+        """Rebuild the in-memory search index and save it to disk."""
+        if (search_index.path is None):
+            raise click.UsageError('SEARCH_INDEX_PATH is not configured')
+        search_index.build()
+        search_index.save()
+        click.echo('indexed %(tokens)d tokens, %(postings)d postings'
+                   % search_index.stats())
+
+    @app.cli.command('import-questions')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', 'import_format', default=None,
+                  type=click.Choice(sorted(IMPORT_FORMATS)),
+                  help='Defaults from the file extension.')
+    @click.option('--chunk-size', default=5000)
+    def import_questions_command(source, import_format, chunk_size):
+        """Load questions from an NDJSON, CSV or COPY (trivia.psql) file."""
+        if (import_format is None):
+            extension = os.path.splitext(source.name)[1].lower()
+            import_format = {
+                '.csv': 'csv', '.psql': 'copy', '.sql': 'copy',
+                '.tsv': 'copy'}.get(extension, 'ndjson')
+
+        report = import_questions(
+            db.engine, IMPORT_FORMATS[import_format](source),
+            chunk_size=chunk_size).format()
+        for error in report['errors']:
+            click.echo('error: %s' % json.dumps(error), err=True)
+        click.echo('imported %d, rejected %d in %.2fs (%s rows/s)' % (
+            report['imported'], report['rejected'], report['seconds'],
+            report['rows_per_second']))
 
     @app.errorhandler(404)
     def not_found(error):
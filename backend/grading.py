@@ -0,0 +1,205 @@
+import re
+import threading
+import time
+import unicodedata
+
+from sqlalchemy import select
+
+import changes
+from models import Question, db
+from spelling import edit_distance
+
+'''
+grading
+    judging a quiz guess against Question.answer on the server. Answers are
+    normalized into their keys when they are written, so a guess costs one
+    normalization and a few bounded edit distances.
+'''
+
+ARTICLES = {'a', 'an', 'the'}
+PUNCTUATION = re.compile(r'[^\w\s]', re.UNICODE)
+ASIDE = re.compile(r'\(([^)]*)\)')
+
+
+'''
+normalize(text)
+    casefolded, accents and punctuation removed, leading articles dropped,
+    whitespace collapsed: "The Palace of Versailles!" -> "palace of
+    versailles"
+'''
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', (text or '').casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    words = PUNCTUATION.sub(' ', text).split()
+    while (len(words) > 1 and words[0] in ARTICLES):
+        words = words[1:]
+    return ' '.join(words)
+
+
+'''
+answer_keys(answer, aliases)
+    the normalized forms a guess may match: the answer, the answer without
+    a parenthesized aside ("Agra (India)" also accepts "Agra"), and the
+    aliases (normalized key -> other keys, e.g. {'usa': ['united states']})
+    of either. Alternatives are only ever aliases: "Trick or Treat" does
+    not accept "treat" unless the alias map says so.
+'''
+
+
+def answer_keys(answer, aliases=None):
+    answer = answer or ''
+    keys = set(normalize(form) for form in (answer, ASIDE.sub(' ', answer)))
+    for key in list(keys):
+        keys.update(
+            normalize(alias) for alias in (aliases or {}).get(key, ()))
+    keys.discard('')
+    return frozenset(keys)
+
+
+def allowed_edits(key, max_distance):
+    # typos forgiven by the length of the key: none under 4 characters,
+    # one up to 7, then max_distance
+    if (len(key) < 4):
+        return 0
+    if (len(key) <= 7):
+        return min(1, max_distance)
+    return max_distance
+
+
+def split_key(key):
+    # (the alphabetic words, the other tokens): only the words may have
+    # typos, "apollo 11" is not "apollo 13"
+    words = key.split()
+    return (' '.join(word for word in words if word.isalpha()),
+            tuple(word for word in words if not word.isalpha()))
+
+
+'''
+AnswerKeys
+    question id -> (answer, its answer_keys, their split_key() forms with
+    the edits allowed), built with one query and kept in step with
+    committed writes: the keys of an added or edited question are computed
+    as its commit is dispatched, never while grading. Writes made by other
+    worker processes are picked up by rebuilding after max_age seconds,
+    like QuestionCounts; in between, the row of an id with no keys is
+    looked up and its keys cached.
+'''
+
+
+class AnswerKeys:
+
+    def __init__(self, aliases=None, max_distance=2, max_age=60):
+        self.aliases = {normalize(key): values
+                        for key, values in (aliases or {}).items()}
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.loaded_at = 0
+        self.keys = None
+        self.graded = 0
+        self.lock = threading.RLock()
+        changes.subscribe(self.on_change)
+
+    @property
+    def ready(self):
+        return self.keys is not None
+
+    def build(self):
+        keys = {}
+        table = Question.__table__
+        query = select([table.c.id, table.c.answer])
+        with db.engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True).execute(query)
+            for question_id, answer in result:
+                keys[question_id] = self.entry(answer)
+
+        with self.lock:
+            self.keys = keys
+            self.loaded_at = time.monotonic()
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.loaded_at > self.max_age
+
+    def ensure(self):
+        if (not self.ready or self.expired):
+            with self.lock:
+                if (not self.ready or self.expired):
+                    self.build()
+
+    def lookup(self, question_id):
+        # the entry of a question this process has not seen written
+        table = Question.__table__
+        answer = db.session.execute(select([table.c.answer]).where(
+            table.c.id == question_id)).first()
+        if (answer is None):
+            return None
+        entry = self.entry(answer[0])
+        with self.lock:
+            if (self.ready):
+                self.keys.setdefault(question_id, entry)
+        return entry
+
+    def on_change(self, change_set):
+        with self.lock:
+            if (not self.ready):
+                return
+            if (change_set.reset):
+                self.keys = None
+                return
+
+            for question in change_set.deleted:
+                self.keys.pop(question['id'], None)
+            for question in change_set.added + [
+                    after for _, after in change_set.updated]:
+                self.keys[question['id']] = self.entry(question['answer'])
+
+    def entry(self, answer):
+        keys = answer_keys(answer, self.aliases)
+        fuzzy = []
+        for key in keys:
+            words, others = split_key(key)
+            limit = allowed_edits(words, self.max_distance)
+            if (limit):
+                fuzzy.append((words, others, limit))
+        return answer, keys, tuple(fuzzy)
+
+    '''
+    grade(question_id, guess)
+        (correct, exact, answer) for a guess at the question, None when
+        there is no such question. A guess is correct when its normalized
+        form is one of the keys (exact), or has the same numbers and other
+        non-alphabetic tokens as one and its words are within
+        allowed_edits() of that key's words
+    '''
+
+    def grade(self, question_id, guess):
+        self.ensure()
+        entry = self.keys.get(question_id)
+        if (entry is None):
+            entry = self.lookup(question_id)
+        if (entry is None):
+            return None
+        answer, keys, fuzzy = entry
+        self.graded += 1
+
+        guess = normalize(guess)
+        if (guess in keys):
+            return True, True, answer
+        words, others = split_key(guess)
+        for key_words, key_others, limit in fuzzy:
+            if (others == key_others
+                    and edit_distance(words, key_words, limit) <= limit):
+                return True, False, answer
+        return False, False, answer
+
+    def stats(self):
+        if (not self.ready):
+            return {'ready': False}
+        return {
+            'ready': True,
+            'answers': len(self.keys),
+            'graded': self.graded
+        }
@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import (
+    Column, String, Integer, Float, ForeignKey, create_engine)
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -34,7 +35,7 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id'))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -54,7 +55,9 @@ class Question(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    def format(self):
+    def format(self, fields=None):
+        if (fields is not None):
+            return {field: getattr(self, field) for field in fields}
         return {
             'id': self.id,
             'question': self.question,
@@ -84,3 +87,53 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+QuizSession
+    a quiz played with a deck of questions dealt up front (see
+    quizsessions.SqlSessionStore); position is the next card to draw
+
+'''
+
+
+class QuizSession(db.Model):
+    __tablename__ = 'quiz_sessions'
+
+    id = Column(String(32), primary_key=True)
+    category = Column(Integer)
+    position = Column(Integer, nullable=False, default=0)
+    size = Column(Integer, nullable=False)
+    expires = Column(Float, nullable=False, index=True)
+
+
+'''
+QuizSessionQuestion
+    one card of a QuizSession deck, keyed by its position in the deck
+
+'''
+
+
+class QuizSessionQuestion(db.Model):
+    __tablename__ = 'quiz_session_questions'
+
+    session_id = Column(String(32), ForeignKey(
+        'quiz_sessions.id', ondelete='CASCADE'), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    question_id = Column(Integer, nullable=False)
+
+
+'''
+BankRevision
+    the number of committed writes to one scope of the question bank (see
+    caches.BankVersion), bumped in the transaction that writes it so every
+    worker process reads the same numbers
+
+'''
+
+
+class BankRevision(db.Model):
+    __tablename__ = 'bank_revisions'
+
+    scope = Column(String(32), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,102 @@
+from sqlalchemy import Integer, any_, bindparam, select
+from sqlalchemy.dialects import postgresql
+
+import changes
+from models import Question
+
+'''
+mutations
+    set-based writes over many questions in one transaction
+'''
+
+
+def _matching(column, ids, dialect):
+    # id = ANY(:ids) binds one array on postgres instead of one parameter
+    # per id; other databases get a plain IN list
+    if (dialect == 'postgresql'):
+        return column == any_(bindparam(
+            'ids', list(ids), type_=postgresql.ARRAY(Integer)))
+    return column.in_(ids)
+
+
+'''
+apply_batch(session, deletes, reassignments, categories)
+    deletes the questions whose ids are in deletes and moves each
+    {'id', 'category'} of reassignments to its category, with one SELECT
+    ... FOR UPDATE, one DELETE and one UPDATE per target category. Nothing
+    is committed here; an id may only be deleted once and reassigned once
+    per batch. Returns the ids of the categories whose counts moved, the
+    number of questions deleted, and one {'id', 'action', 'outcome'} per
+    input:
+        deleted / reassigned    done
+        unchanged               already in that category
+        not_found               no such question
+        invalid_category        the category is not in categories
+        conflict                the id is also being deleted
+    The changes are recorded on the session, so caches follow the commit.
+'''
+
+
+def apply_batch(session, deletes, reassignments, categories):
+    questions = Question.__table__
+    dialect = session.get_bind().dialect.name
+    ids = set(deletes) | set(item['id'] for item in reassignments)
+
+    rows = {}
+    if (ids):
+        selection = select([questions]).where(
+            _matching(questions.c.id, list(ids), dialect)).with_for_update()
+        for row in session.execute(selection):
+            rows[row.id] = {key: row[key] for key in (
+                'id', 'question', 'answer', 'category', 'difficulty')}
+
+    results = []
+    touched = set()
+    pending = changes.pending(session)
+
+    # delete_ids keeps the order for the statement, deleting answers the
+    # membership checks
+    delete_ids = []
+    deleting = set()
+    for question_id in deletes:
+        if (question_id not in rows):
+            outcome = 'not_found'
+        else:
+            outcome = 'deleted'
+            delete_ids.append(question_id)
+            deleting.add(question_id)
+            touched.add(rows[question_id]['category'])
+            pending.deleted.append(rows[question_id])
+        results.append(
+            {'id': question_id, 'action': 'delete', 'outcome': outcome})
+
+    moves = {}
+    for item in reassignments:
+        question_id, category = item['id'], item['category']
+        before = rows.get(question_id)
+        if (before is None):
+            outcome = 'not_found'
+        elif (question_id in deleting):
+            outcome = 'conflict'
+        elif (category not in categories):
+            outcome = 'invalid_category'
+        elif (before['category'] == category):
+            outcome = 'unchanged'
+        else:
+            outcome = 'reassigned'
+            moves.setdefault(category, []).append(question_id)
+            touched.update((before['category'], category))
+            pending.updated.append((before, dict(before, category=category)))
+            rows[question_id] = dict(before, category=category)
+        results.append(
+            {'id': question_id, 'action': 'reassign', 'outcome': outcome})
+
+    if (delete_ids):
+        session.execute(questions.delete().where(
+            _matching(questions.c.id, delete_ids, dialect)))
+    for category, question_ids in moves.items():
+        session.execute(questions.update().where(
+            _matching(questions.c.id, question_ids, dialect)).values(
+            category=category))
+
+    return touched, len(delete_ids), results
@@ -0,0 +1,458 @@
+import collections
+import random
+import threading
+import time
+
+from sqlalchemy import select
+
+import changes
+from models import Question, db
+
+'''
+quizpool
+    per-category pools of question ids for drawing quiz questions without
+    loading the category from the database
+'''
+
+
+'''
+IdPool
+    the ids of one category in no particular order, with the position of
+    each, so adding and removing an id are O(1) (a removed id is replaced
+    by the last one)
+'''
+
+
+class IdPool:
+
+    def __init__(self, ids=()):
+        self.ids = list(ids)
+        self.positions = {
+            question_id: index for index, question_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, question_id):
+        if (question_id not in self.positions):
+            self.positions[question_id] = len(self.ids)
+            self.ids.append(question_id)
+
+    def remove(self, question_id):
+        index = self.positions.pop(question_id, None)
+        if (index is None):
+            return
+        last = self.ids.pop()
+        if (index < len(self.ids)):
+            self.ids[index] = last
+            self.positions[last] = index
+
+    '''
+    sample(seen, count, rng)
+        up to count distinct ids drawn uniformly from the ids not in seen,
+        in O(len(seen) + count) whatever the size of the pool. A count of
+        None shuffles every unseen id. seen may be any sized container.
+
+        While at least a tenth of the pool is unseen, random slots are
+        simply redrawn until they hit an unseen id (at most ten tries per
+        id on average). Past that, the pool is not changed: the seen ids
+        are moved past the end of a virtual copy, then a partial
+        Fisher-Yates shuffle runs over the part left. A seen slot below the
+        new end swaps places with the next unseen slot above it only when
+        the shuffle reaches it. Only the moved slots are stored, in slots.
+    '''
+
+    def sample(self, seen, count=1, rng=random):
+        if (count is None):
+            count = len(self.ids)
+        if (10 * (len(seen) + count) <= 9 * len(self.ids)):
+            if (count > 1 and isinstance(seen, (list, tuple))):
+                # one id takes a few probes, each cheaper as a scan of the
+                # list than hashing all of it
+                seen = set(seen)
+            drawn = []
+            taken = set()
+            while (len(drawn) < count):
+                question_id = self.ids[rng.randrange(len(self.ids))]
+                if (question_id not in seen and question_id not in taken):
+                    taken.add(question_id)
+                    drawn.append(question_id)
+            return drawn
+
+        seen_slots = set(map(self.positions.get, seen))
+        seen_slots.discard(None)
+        size = len(self.ids) - len(seen_slots)
+        fillers = (index for index in range(size, len(self.ids))
+                   if index not in seen_slots)
+        slots = {}
+
+        def slot(index):
+            # where the virtual copy holds position index
+            if (index not in slots):
+                slots[index] = (
+                    next(fillers) if index in seen_slots else index)
+            return slots[index]
+
+        drawn = []
+        for position in range(min(count, size)):
+            chosen = rng.randrange(position, size)
+            index = slot(chosen)
+            slots[chosen] = slot(position)
+            drawn.append(self.ids[index])
+        return drawn
+
+
+'''
+AliasTable
+    Walker's alias method: after O(n) setup over n weighted outcomes, a
+    draw is one random slot and one biased coin, O(1) whatever the weights
+'''
+
+
+class AliasTable:
+
+    def __init__(self, outcomes, weights):
+        self.outcomes = list(outcomes)
+        size = len(self.outcomes)
+        total = float(sum(weights))
+        self.probability = [1.0] * size
+        self.alias = list(range(size))
+        if (total <= 0):
+            self.outcomes = []
+            return
+
+        scaled = [weight * size / total for weight in weights]
+        small = [index for index, value in enumerate(scaled) if value < 1]
+        large = [index for index, value in enumerate(scaled) if value >= 1]
+        while (small and large):
+            lower, upper = small.pop(), large.pop()
+            self.probability[lower] = scaled[lower]
+            self.alias[lower] = upper
+            scaled[upper] -= 1 - scaled[lower]
+            (small if scaled[upper] < 1 else large).append(upper)
+
+    def draw(self, rng=random):
+        if (not self.outcomes):
+            return None
+        index = rng.randrange(len(self.outcomes))
+        if (rng.random() >= self.probability[index]):
+            index = self.alias[index]
+        return self.outcomes[index]
+
+
+'''
+QuestionPools
+    category id -> IdPool, the same ids split by difficulty in levels
+    (category -> difficulty -> IdPool), and question id -> category and
+    question id -> difficulty to tell which pools a seen id belongs to.
+    Built with one query and kept in step with committed writes like the
+    search indexes; a bulk change drops the pools and the next draw
+    rebuilds them. Writes made by other worker processes are picked up by
+    rebuilding after max_age seconds, like QuestionCounts; in between, a
+    drawn id whose row is gone is dropped with discard().
+
+    tables caches the AliasTable of each (category, difficulty target);
+    a write drops those of the categories it touched and the next draw
+    rebuilds them from the level sizes.
+'''
+
+
+class QuestionPools:
+
+    def __init__(self, spread=0.5, max_age=60):
+        self.spread = spread
+        self.max_age = max_age
+        self.loaded_at = 0
+        self.pools = None
+        self.levels = None
+        self.categories = None
+        self.difficulties = None
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.rng = random.Random()
+        self.draws = 0
+        changes.subscribe(self.on_change)
+
+    @property
+    def ready(self):
+        return self.pools is not None
+
+    def build(self):
+        grouped = {}
+        leveled = {}
+        categories = {}
+        difficulties = {}
+        table = Question.__table__
+        query = select([table.c.id, table.c.category, table.c.difficulty])
+        with db.engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True).execute(query)
+            for question_id, category, difficulty in result:
+                grouped.setdefault(category, []).append(question_id)
+                leveled.setdefault(category, {}).setdefault(
+                    difficulty, []).append(question_id)
+                categories[question_id] = category
+                difficulties[question_id] = difficulty
+
+        with self.lock:
+            self.pools = {
+                category: IdPool(ids) for category, ids in grouped.items()}
+            self.levels = {
+                category: {difficulty: IdPool(ids)
+                           for difficulty, ids in levels.items()}
+                for category, levels in leveled.items()}
+            self.categories = categories
+            self.difficulties = difficulties
+            self.tables = {}
+            self.loaded_at = time.monotonic()
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.loaded_at > self.max_age
+
+    def ensure(self):
+        if (not self.ready or self.expired):
+            with self.lock:
+                if (not self.ready or self.expired):
+                    self.build()
+
+    def add(self, question):
+        category = question['category']
+        if (category not in self.pools):
+            self.pools[category] = IdPool()
+            self.levels[category] = {}
+        self.pools[category].add(question['id'])
+        levels = self.levels[category]
+        if (question['difficulty'] not in levels):
+            levels[question['difficulty']] = IdPool()
+        levels[question['difficulty']].add(question['id'])
+        self.categories[question['id']] = category
+        self.difficulties[question['id']] = question['difficulty']
+
+    def remove(self, question):
+        self.categories.pop(question['id'], None)
+        self.difficulties.pop(question['id'], None)
+        pool = self.pools.get(question['category'])
+        if (pool is not None):
+            pool.remove(question['id'])
+            level = self.levels[question['category']].get(
+                question['difficulty'])
+            if (level is not None):
+                level.remove(question['id'])
+
+    def on_change(self, change_set):
+        with self.lock:
+            if (not self.ready):
+                return
+            if (change_set.reset):
+                self.pools = self.levels = None
+                self.categories = self.difficulties = None
+                self.tables = {}
+                return
+
+            questions = change_set.deleted + change_set.added
+            for question in change_set.deleted:
+                self.remove(question)
+            for before, after in change_set.updated:
+                self.remove(before)
+                self.add(after)
+                questions += [before, after]
+            for question in change_set.added:
+                self.add(question)
+
+            self.drop_tables(
+                set(question['category'] for question in questions))
+
+    def drop_tables(self, touched):
+        for key in [key for key in self.tables if key[0] in touched]:
+            del self.tables[key]
+
+    '''
+    discard(question_id)
+        removes an id whose row turned out to be gone, deleted through
+        another worker since the pools were built
+    '''
+
+    def discard(self, question_id):
+        with self.lock:
+            if (not self.ready or question_id not in self.categories):
+                return
+            category = self.categories[question_id]
+            self.remove({
+                'id': question_id,
+                'category': category,
+                'difficulty': self.difficulties[question_id]
+            })
+            self.drop_tables({category})
+
+    def selected(self, categories):
+        if (categories is None):
+            return dict(self.pools)
+        return {category: self.pools[category] for category in categories
+                if category in self.pools}
+
+    def split(self, pools, seen):
+        # the seen ids of each pool, and how many ids each has left
+        seen_in = {category: set() for category in pools}
+        for question_id in seen:
+            category = self.categories.get(question_id)
+            if (category in seen_in):
+                seen_in[category].add(question_id)
+        left = {category: len(pool) - len(seen_in[category])
+                for category, pool in pools.items()}
+        return seen_in, left
+
+    def picks(self, left, count, weights):
+        # the category of each of count draws, see sample()
+        picks = []
+        for _ in range(count):
+            candidates = [category for category in left
+                          if left[category] > 0]
+            if (weights is not None):
+                candidates = [category for category in candidates
+                              if weights.get(category, 0) > 0]
+            if (not candidates):
+                break
+            if (weights is None):
+                shares = [left[category] for category in candidates]
+            else:
+                shares = [weights[category] for category in candidates]
+            category = self.rng.choices(candidates, shares)[0]
+            left[category] -= 1
+            picks.append(category)
+        return picks
+
+    '''
+    sample(categories, seen, count, weights)
+        up to count distinct ids of the given categories (a list, None for
+        all of them) not in seen, in the order they were drawn (all of
+        them when count is None); an empty list once they are exhausted.
+
+        Each draw first picks a category, then an id in it. Without
+        weights a category is picked in proportion to the ids it has left,
+        which is the same as drawing from the union of the pools. weights
+        (category id -> number) sets the share of each category instead,
+        among those with ids left. The picks are made first, then each
+        pool is sampled once for all of its picks.
+    '''
+
+    def sample(self, categories, seen, count=1, weights=None):
+        self.ensure()
+        with self.lock:
+            pools = self.selected(categories)
+            self.draws += 1
+            if (not pools):
+                return []
+            if (len(pools) == 1):
+                pool, = pools.values()
+                return pool.sample(seen, count, self.rng)
+
+            seen_in, left = self.split(pools, seen)
+            if (count is None):
+                count = sum(left.values())
+            picks = self.picks(left, count, weights)
+
+            drawn = {category: pools[category].sample(
+                seen_in[category], number, self.rng)
+                for category, number in collections.Counter(picks).items()}
+            return [drawn[category].pop() for category in picks]
+
+    def table(self, category, target):
+        key = (category, target)
+        table = self.tables.get(key)
+        if (table is None):
+            levels = self.levels[category]
+            difficulties = sorted(levels)
+            table = self.tables[key] = AliasTable(difficulties, [
+                len(levels[difficulty]) * self.weight(difficulty, target)
+                for difficulty in difficulties])
+        return table
+
+    def weight(self, difficulty, target):
+        return self.spread ** abs(difficulty - target)
+
+    '''
+    sample_difficulty(categories, seen, count, target, weights)
+        sample() leaning toward the difficulty target: within the picked
+        category each unseen question weighs spread ** |difficulty -
+        target|, so with the default spread of 0.5 a question one level
+        off the target is half as likely.
+
+        The cached alias table of (category, target) weighs the levels by
+        their full size, so a level it draws is kept with probability
+        unseen / size, which turns the weights into those of the unseen
+        questions; then an unseen id of that level is drawn. After
+        ACCEPT_TRIES rejections (most of the category seen) the level is
+        drawn from a table built from the unseen counts instead, at most
+        one outcome per difficulty. The unseen counts per level take one
+        pass over seen.
+    '''
+
+    ACCEPT_TRIES = 8
+
+    def sample_difficulty(self, categories, seen, count=1, target=3,
+                          weights=None):
+        self.ensure()
+        with self.lock:
+            pools = self.selected(categories)
+            self.draws += 1
+            excluded = set(seen)
+            _, left = self.split(pools, excluded)
+
+            unseen = {category: collections.Counter({
+                difficulty: len(level) for difficulty, level in
+                self.levels[category].items()}) for category in pools}
+            for question_id in excluded:
+                category = self.categories.get(question_id)
+                if (category in unseen):
+                    unseen[category][self.difficulties[question_id]] -= 1
+
+            drawn = []
+            for category in self.picks(left, count, weights):
+                question_id = self.draw_level(
+                    category, excluded, target, unseen[category])
+                excluded.add(question_id)
+                drawn.append(question_id)
+            return drawn
+
+    def draw_level(self, category, excluded, target, unseen):
+        levels = self.levels[category]
+        table = self.table(category, target)
+        difficulty = None
+        for _ in range(self.ACCEPT_TRIES):
+            drawn = table.draw(self.rng)
+            if (drawn is None):
+                break
+            if (self.rng.random() * len(levels[drawn]) < unseen[drawn]):
+                difficulty = drawn
+                break
+
+        if (difficulty is None):
+            difficulties = [difficulty for difficulty in sorted(unseen)
+                            if unseen[difficulty] > 0]
+            difficulty = AliasTable(difficulties, [
+                unseen[difficulty] * self.weight(difficulty, target)
+                for difficulty in difficulties]).draw(self.rng)
+
+        if (difficulty is None):
+            # a spread of 0 and nothing left at the target
+            question_id = self.pools[category].sample(
+                excluded, 1, self.rng)[0]
+            difficulty = self.difficulties[question_id]
+        else:
+            question_id = levels[difficulty].sample(
+                excluded, 1, self.rng)[0]
+        unseen[difficulty] -= 1
+        return question_id
+
+    def stats(self):
+        if (not self.ready):
+            return {'ready': False}
+        return {
+            'ready': True,
+            'categories': len(self.pools),
+            'questions': sum(len(pool) for pool in self.pools.values()),
+            'alias_tables': len(self.tables),
+            'draws': self.draws,
+            'age': round(time.monotonic() - self.loaded_at, 3)
+        }
@@ -0,0 +1,115 @@
+import random
+
+from sqlalchemy import (
+    Integer, all_, any_, bindparam, func, literal_column, select, text,
+    union_all)
+from sqlalchemy.dialects import postgresql
+
+from models import Question, db
+from search import has_column, forget_columns
+
+'''
+quizrandom
+    drawing quiz questions in the database, for banks too large to keep
+    the id pools of quizpool in every worker
+'''
+
+# every row gets a uniform key in [0, 1) (existing rows too, as the default
+# is volatile); the indexes let a draw start at any key and read in order
+RANDOM_KEY_SETUP = [
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS random_key "
+    "double precision NOT NULL DEFAULT random()",
+    "CREATE INDEX IF NOT EXISTS questions_random_key_idx "
+    "ON questions (random_key)",
+    "CREATE INDEX IF NOT EXISTS questions_category_random_key_idx "
+    "ON questions (category, random_key)",
+]
+
+
+'''
+setup_random_keys(engine)
+    adds the random_key column and its indexes (postgres). Like
+    setup_search() this rewrites the table, so it is a CLI command. Safe to
+    run again.
+'''
+
+
+def setup_random_keys(engine):
+    with engine.begin() as connection:
+        for statement in RANDOM_KEY_SETUP:
+            connection.execute(text(statement))
+    forget_columns()
+
+
+def _where(selection, categories, seen, dialect):
+    questions = Question.__table__
+    if (categories is not None and len(categories) == 1):
+        # keeps the (category, random_key) index usable for the ordering
+        selection = selection.where(questions.c.category == categories[0])
+        categories = None
+
+    if (dialect == 'postgresql'):
+        # one array parameter each, however long the lists
+        if (categories is not None):
+            selection = selection.where(questions.c.category == any_(
+                bindparam('categories', categories,
+                          type_=postgresql.ARRAY(Integer))))
+        if (seen):
+            selection = selection.where(questions.c.id != all_(
+                bindparam('seen', seen, type_=postgresql.ARRAY(Integer))))
+        return selection
+
+    if (categories is not None):
+        selection = selection.where(questions.c.category.in_(categories))
+    if (seen):
+        selection = selection.where(~questions.c.id.in_(seen))
+    return selection
+
+
+'''
+random_rows(categories, seen, count, columns)
+    up to count rows (all of them when count is None) of the questions in
+    categories (None for all) whose ids are not in seen, in random order,
+    with one statement. Only columns are selected, all by default.
+
+    With the random_key column, a random start key is drawn and the rows
+    are read in key order from there, wrapping around to the lowest keys
+    when too few are left above it: two index range scans glued by UNION
+    ALL, the second one only run when the first comes up short, so a draw
+    costs O(log n) plus the seen rows skipped on the way. A row after a
+    wide gap in the keys is a little more likely to be picked; the keys
+    are uniform so the skew stays small. A batch is the run of rows
+    following the start key, shuffled: random, but not independent draws.
+    Without the column (before
+    setup-random-keys, or on sqlite) it falls back to ORDER BY random(),
+    which reads every candidate row.
+'''
+
+
+def random_rows(categories, seen, count=1, columns=None):
+    questions = Question.__table__
+    if (columns is None):
+        columns = list(questions.columns)
+    seen = [question_id for question_id in seen
+            if isinstance(question_id, int)]
+    dialect = db.engine.dialect.name
+
+    if (not has_column('random_key')):
+        selection = _where(select(columns), categories, seen, dialect)
+        selection = selection.order_by(func.random()).limit(count)
+        return db.session.execute(selection).fetchall()
+
+    key = literal_column('questions.random_key')
+    start = bindparam('start', random.random())
+
+    def scan(condition, name):
+        selection = _where(select(columns), categories, seen, dialect)
+        return selection.where(condition).order_by(key).limit(
+            count).alias(name)
+
+    above = scan(key >= start, 'above')
+    below = scan(key < start, 'below')
+    selection = union_all(select([above]), select([below])).limit(count)
+    rows = db.session.execute(selection).fetchall()
+    random.shuffle(rows)
+    return rows
@@ -0,0 +1,133 @@
+import collections
+import threading
+import time
+import uuid
+
+from models import QuizSession, QuizSessionQuestion, db
+
+'''
+quizsessions
+    server-side quiz sessions: the deck of question ids is shuffled once
+    when the quiz starts, and each draw takes the next card, so neither the
+    request nor the work per question grows with the length of the quiz.
+
+    A store has create(category, deck) -> session id, draw(session_id) ->
+    (question id or None when the deck is empty, cards left) which raises
+    KeyError for an unknown or expired session, and stats().
+'''
+
+
+'''
+MemorySessionStore
+    sessions in process, least recently used first; at most max_size are
+    kept and one unused for ttl seconds expires. The deck is stored
+    reversed so a draw is a list pop.
+'''
+
+
+class MemorySessionStore:
+
+    def __init__(self, max_size=1024, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sessions = collections.OrderedDict()
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def create(self, category, deck):
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = (
+                category, list(reversed(deck)), time.monotonic() + self.ttl)
+            while (len(self.sessions) > self.max_size):
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+        return session_id
+
+    def draw(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if (session is None or session[2] < time.monotonic()):
+                self.sessions.pop(session_id, None)
+                raise KeyError(session_id)
+            category, deck, _ = session
+            self.sessions[session_id] = (
+                category, deck, time.monotonic() + self.ttl)
+            self.sessions.move_to_end(session_id)
+            if (not deck):
+                return None, 0
+            return deck.pop(), len(deck)
+
+    def stats(self):
+        return {
+            'store': 'memory',
+            'sessions': len(self.sessions),
+            'evictions': self.evictions
+        }
+
+
+'''
+SqlSessionStore
+    sessions in the quiz_sessions table, shared by every worker process.
+    The deck is one quiz_session_questions row per card keyed by
+    (session, position), so a draw reads the session row, the card at its
+    position and moves the position on: primary key lookups only. Expired
+    sessions are deleted when a new one starts.
+'''
+
+
+class SqlSessionStore:
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+
+    def purge(self, now):
+        expired = db.session.query(QuizSession.id).filter(
+            QuizSession.expires < now)
+        QuizSessionQuestion.query.filter(
+            QuizSessionQuestion.session_id.in_(expired.subquery())).delete(
+            synchronize_session=False)
+        QuizSession.query.filter(QuizSession.expires < now).delete(
+            synchronize_session=False)
+
+    def create(self, category, deck):
+        now = time.time()
+        self.purge(now)
+        session_id = uuid.uuid4().hex
+        db.session.add(QuizSession(
+            id=session_id, category=category, position=0, size=len(deck),
+            expires=now + self.ttl))
+        db.session.flush()
+        if (deck):
+            db.session.execute(QuizSessionQuestion.__table__.insert(), [
+                {'session_id': session_id, 'position': position,
+                 'question_id': question_id}
+                for position, question_id in enumerate(deck)])
+        db.session.commit()
+        return session_id
+
+    def draw(self, session_id):
+        now = time.time()
+        session = QuizSession.query.filter_by(
+            id=session_id).with_for_update().one_or_none()
+        if (session is None or session.expires < now):
+            db.session.rollback()
+            raise KeyError(session_id)
+        session.expires = now + self.ttl
+        if (session.position >= session.size):
+            db.session.commit()
+            return None, 0
+
+        question_id = db.session.query(
+            QuizSessionQuestion.question_id).filter_by(
+            session_id=session_id, position=session.position).scalar()
+        session.position += 1
+        remaining = session.size - session.position
+        db.session.commit()
+        return question_id, remaining
+
+    def stats(self):
+        return {
+            'store': 'sql',
+            'sessions': QuizSession.query.count()
+        }
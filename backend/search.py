@@ -0,0 +1,203 @@
+from sqlalchemy import func, inspect, literal_column, text
+
+from models import Question, db
+
+'''
+search
+    the ways search_questions can match a search term. Each build function
+    returns the filtered Question query and whether it is ordered by
+    relevance (ranked results are paged by offset, not by id).
+'''
+
+SEARCH_CONFIG = 'english'
+
+# question text weighs more than the answer
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(question, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(answer, '')), 'B')")
+
+SEARCH_SETUP = [
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (" + SEARCH_DOCUMENT + ") STORED",
+    "CREATE INDEX IF NOT EXISTS questions_search_vector_idx "
+    "ON questions USING GIN (search_vector)",
+]
+
+# trigram indexes serve both ILIKE '%term%' and the fuzzy operators
+TRIGRAM_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS questions_question_trgm_idx "
+    "ON questions USING GIN (question gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS questions_answer_trgm_idx "
+    "ON questions USING GIN (answer gin_trgm_ops)",
+]
+
+FUZZY_THRESHOLD = 0.5
+
+
+'''
+setup_search(engine)
+    adds the generated search_vector column and its GIN index (postgres 12
+    or later) and the pg_trgm GIN indexes on question and answer. Adding
+    the column rewrites the table, which is why this is a CLI command and
+    not done at startup. Safe to run again.
+'''
+
+
+def setup_search(engine, fulltext=True, trigram=True):
+    statements = ((SEARCH_SETUP if fulltext else [])
+                  + (TRIGRAM_SETUP if trigram else []))
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    forget_columns()
+
+
+_columns = {}
+
+
+def forget_columns():
+    # after DDL on the questions table
+    _columns.clear()
+
+
+def has_column(name):
+    # looked up once per engine, forget_columns() resets it
+    key = (str(db.engine.url), name)
+    if (key not in _columns):
+        _columns[key] = name in [
+            column['name'] for column in
+            inspect(db.engine).get_columns('questions')]
+    return _columns[key]
+
+
+def substring_search(term, options):
+    # uses questions_question_trgm_idx on postgres once it exists
+    return Question.query.filter(
+        Question.question.ilike('%' + term + '%')), False
+
+
+def search_vector():
+    # the stored column when setup_search() ran, otherwise the same
+    # document computed row by row (correct, but a sequential scan)
+    if (has_column('search_vector')):
+        return literal_column('questions.search_vector')
+    return literal_column('(' + SEARCH_DOCUMENT + ')')
+
+
+def fulltext_search(term, options):
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, term)
+    vector = search_vector()
+    return Question.query.filter(vector.op('@@')(query)).order_by(
+        func.ts_rank(vector, query).desc()), True
+
+
+'''
+fuzzy_search(term, options)
+    questions with a word close to term in their question or answer text,
+    by trigram word similarity (term <% text), most similar first.
+    options['threshold'] (0 to 1, FUZZY_THRESHOLD by default) is how close
+    is close enough; it is set for the current transaction only.
+'''
+
+
+def fuzzy_search(term, options):
+    threshold = options.get('threshold', FUZZY_THRESHOLD)
+    db.session.execute(
+        text("SELECT set_config("
+             "'pg_trgm.word_similarity_threshold', :threshold, true)"),
+        {'threshold': str(threshold)})
+
+    similarity = func.greatest(
+        func.word_similarity(term, Question.question),
+        func.word_similarity(term, Question.answer))
+    # text() so the % of the operator is escaped for the driver
+    matches = text("(:term <% questions.question "
+                   "OR :term <% questions.answer)").bindparams(term=term)
+    return Question.query.filter(matches).order_by(
+        similarity.desc()), True
+
+
+'''
+headlines(ids, term)
+    ts_headline snippets of the question and answer text for ids, with the
+    matches wrapped in <b></b>. Only run for the page being returned, since
+    ts_headline re-parses the documents.
+'''
+
+
+def headlines(ids, term):
+    if (not ids):
+        return {}
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, term)
+    rows = db.session.query(
+        Question.id,
+        func.ts_headline(SEARCH_CONFIG, Question.question, query),
+        func.ts_headline(SEARCH_CONFIG, Question.answer, query)).filter(
+        Question.id.in_(ids)).all()
+    return {question_id: {'question': question, 'answer': answer}
+            for question_id, question, answer in rows}
+
+
+SEARCH_MODES = {
+    'substring': (substring_search, None),
+    'fulltext': (fulltext_search, 'postgresql'),
+    'fuzzy': (fuzzy_search, 'postgresql')
+}
+
+
+'''
+build_search(mode, term, options)
+    the query for term in mode, or None when mode is unknown or needs
+    another database. options holds the mode's own settings from the
+    request body.
+'''
+
+
+def build_search(mode, term, options=None):
+    if (mode not in SEARCH_MODES):
+        return None
+    build, dialect = SEARCH_MODES[mode]
+    if (dialect is not None and db.engine.dialect.name != dialect):
+        return None
+    return build(term, options or {})
+
+
+'''
+facet_rows(selection)
+    (category, difficulty, count) for the matches of selection, in one
+    GROUP BY over both columns
+'''
+
+
+def facet_rows(selection):
+    return selection.order_by(None).with_entities(
+        Question.category, Question.difficulty,
+        func.count(Question.id)).group_by(
+        Question.category, Question.difficulty).all()
+
+
+'''
+facets(rows, categories, difficulties)
+    the category and difficulty facets of rows, and the number of matches
+    passing both filters (None means no filter). Each facet is counted with
+    the other facet's filter applied but not its own, so it lists the
+    alternatives to the current choice.
+'''
+
+
+def facets(rows, categories=None, difficulties=None):
+    by_category = {}
+    by_difficulty = {}
+    total = 0
+    for category, difficulty, count in rows:
+        category_ok = categories is None or category in categories
+        difficulty_ok = difficulties is None or difficulty in difficulties
+        if (difficulty_ok):
+            by_category[category] = by_category.get(category, 0) + count
+        if (category_ok):
+            by_difficulty[difficulty] = by_difficulty.get(
+                difficulty, 0) + count
+        if (category_ok and difficulty_ok):
+            total += count
+    return {'category': by_category, 'difficulty': by_difficulty}, total
@@ -0,0 +1,186 @@
+import base64
+import binascii
+
+from itsdangerous import BadSignature, Signer
+
+'''
+seenset
+    the questions a quiz has already shown, as a bitset, and its compact
+    text form for clients that would otherwise send a growing
+    previous_questions list.
+
+    A token is "<kind>.<payload>", with the payload base64url encoded:
+        b   the bitmap, bit i of byte i // 8 set when id i was seen
+        r   varint pairs (gap since the end of the previous run, run length)
+    encode() picks whichever is shorter. With a signer the token carries an
+    HMAC, so the server can trust it came from itself unchanged.
+'''
+
+SALT = 'quiz-seen'
+
+
+'''
+Bitset
+    a set of non-negative ints over a bytearray: O(1) add and membership,
+    and len() without counting
+'''
+
+
+class Bitset:
+
+    def __init__(self, data=b''):
+        self.bits = bytearray(data)
+        self.count = bin(int.from_bytes(self.bits, 'little')).count('1')
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, value):
+        if (not isinstance(value, int) or value < 0):
+            return False
+        index = value >> 3
+        return (index < len(self.bits)
+                and bool(self.bits[index] >> (value & 7) & 1))
+
+    def __iter__(self):
+        for index, byte in enumerate(self.bits):
+            while (byte):
+                low = byte & -byte
+                yield index * 8 + low.bit_length() - 1
+                byte ^= low
+
+    def add(self, value):
+        if (value in self):
+            return
+        index = value >> 3
+        if (index >= len(self.bits)):
+            self.bits.extend(bytes(index + 1 - len(self.bits)))
+        self.bits[index] |= 1 << (value & 7)
+        self.count += 1
+
+    def runs(self):
+        # (start, length) of each run of consecutive ids, in order
+        start = end = None
+        for value in self:
+            if (value == end):
+                end += 1
+                continue
+            if (start is not None):
+                yield start, end - start
+            start, end = value, value + 1
+        if (start is not None):
+            yield start, end - start
+
+
+def _fill(bits, start, end):
+    # sets bits start to end - 1, a byte at a time
+    first, last = start >> 3, (end - 1) >> 3
+    if (last >= len(bits)):
+        bits.extend(bytes(last + 1 - len(bits)))
+    if (first == last):
+        bits[first] |= ((1 << (end - start)) - 1) << (start & 7)
+        return
+    bits[first] |= 0xff << (start & 7) & 0xff
+    bits[first + 1:last] = b'\xff' * (last - first - 1)
+    bits[last] |= (1 << ((end - 1) & 7) + 1) - 1
+
+
+def _varints(numbers):
+    encoded = bytearray()
+    for number in numbers:
+        while (number > 0x7f):
+            encoded.append(number & 0x7f | 0x80)
+            number >>= 7
+        encoded.append(number)
+    return bytes(encoded)
+
+
+def _read_varints(data):
+    number = shift = 0
+    for byte in data:
+        number |= (byte & 0x7f) << shift
+        shift += 7
+        if (not byte & 0x80):
+            yield number
+            number = shift = 0
+    if (shift):
+        raise ValueError('truncated varint')
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    try:
+        return base64.b64decode(
+            text + '=' * (-len(text) % 4), altchars=b'-_', validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('bad base64')
+
+
+def signer(secret):
+    return Signer(secret, salt=SALT) if secret else None
+
+
+'''
+encode(seen, signer)
+    the token of a Bitset
+'''
+
+
+def encode(seen, signer=None):
+    numbers = []
+    end = 0
+    for start, length in seen.runs():
+        numbers += [start - end, length]
+        end = start + length
+    ranges = 'r.' + _b64encode(_varints(numbers))
+    bitmap = 'b.' + _b64encode(bytes(seen.bits).rstrip(b'\0'))
+    token = ranges if len(ranges) < len(bitmap) else bitmap
+    if (signer is not None):
+        token = signer.sign(token).decode('ascii')
+    return token
+
+
+'''
+decode(token, signer, limit)
+    the Bitset of a token; ValueError when it is malformed, unsigned or
+    tampered with (given a signer), or holds an id of limit or more
+'''
+
+
+def decode(token, signer=None, limit=1 << 24):
+    if (not isinstance(token, str)):
+        raise ValueError('not a token')
+    if (token == ''):
+        # a quiz that has not shown anything yet
+        return Bitset()
+    if (signer is not None):
+        try:
+            token = signer.unsign(token).decode('ascii')
+        except BadSignature:
+            raise ValueError('bad signature')
+
+    kind, _, payload = token.partition('.')
+    data = _b64decode(payload)
+    if (kind == 'b'):
+        if (len(data) * 8 > limit):
+            raise ValueError('id out of range')
+        return Bitset(data)
+    if (kind != 'r'):
+        raise ValueError('unknown kind')
+
+    numbers = list(_read_varints(data))
+    if (len(numbers) % 2):
+        raise ValueError('odd number of varints')
+    bits = bytearray()
+    end = 0
+    for position in range(0, len(numbers), 2):
+        start = end + numbers[position]
+        end = start + numbers[position + 1]
+        if (end > limit):
+            raise ValueError('id out of range')
+        if (end > start):
+            _fill(bits, start, end)
+    return Bitset(bits)
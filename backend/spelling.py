@@ -0,0 +1,218 @@
+import threading
+
+from sqlalchemy import select
+
+import changes
+from models import Question, db
+from textindex import tokenize
+
+'''
+spelling
+    "did you mean" corrections for searches that found nothing, from the
+    vocabulary of the question bank
+'''
+
+
+def edit_distance(left, right, limit):
+    # optimal string alignment distance (a transposition counts as one
+    # edit), giving up with limit + 1 as soon as every cell of a row is over
+    # the limit
+    if (abs(len(left) - len(right)) > limit):
+        return limit + 1
+
+    previous_row = None
+    row = list(range(len(right) + 1))
+    for i in range(1, len(left) + 1):
+        before, previous_row, row = previous_row, row, [i] + [0] * len(right)
+        for j in range(1, len(right) + 1):
+            cost = 0 if left[i - 1] == right[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1,
+                         previous_row[j - 1] + cost)
+            if (i > 1 and j > 1 and left[i - 1] == right[j - 2]
+                    and left[i - 2] == right[j - 1]):
+                row[j] = min(row[j], before[j - 2] + 1)
+        if (min(row) > limit):
+            return limit + 1
+    return row[-1]
+
+
+'''
+SpellingDictionary
+    a symmetric delete (SymSpell) dictionary: every word is stored under
+    each string obtained by deleting up to max_distance characters from its
+    first prefix_length characters. A misspelling shares one of those
+    strings with the words it is close to, so a lookup generates the
+    deletes of the query, collects the candidates and only computes the
+    edit distance to those. Word counts follow committed writes, a word
+    leaves the dictionary when its count drops to zero.
+
+    Most deletes belong to a single word, so deletes maps each one to that
+    word, widened to a tuple of words only when several share it: a set per
+    delete made the dictionary several times larger.
+'''
+
+
+class SpellingDictionary:
+
+    def __init__(self, max_distance=2, prefix_length=7, min_length=3):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        self.counts = None
+        self.deletes = None
+        self.lock = threading.RLock()
+        changes.subscribe(self.on_change)
+
+    @property
+    def ready(self):
+        return self.counts is not None
+
+    def edits(self, word):
+        key = word[:self.prefix_length]
+        found = {key}
+        frontier = [key]
+        for _ in range(self.max_distance):
+            next_frontier = []
+            for candidate in frontier:
+                if (len(candidate) <= 1):
+                    continue
+                for index in range(len(candidate)):
+                    shorter = candidate[:index] + candidate[index + 1:]
+                    if (shorter not in found):
+                        found.add(shorter)
+                        next_frontier.append(shorter)
+            frontier = next_frontier
+        return found
+
+    def add_word(self, word, count=1):
+        if (len(word) < self.min_length or word.isdigit()):
+            return
+        previous = self.counts.get(word, 0)
+        self.counts[word] = previous + count
+        if (previous == 0):
+            deletes = self.deletes
+            for delete in self.edits(word):
+                words = deletes.get(delete)
+                if (words is None):
+                    deletes[delete] = word
+                elif (isinstance(words, str)):
+                    deletes[delete] = (words, word)
+                else:
+                    deletes[delete] = words + (word,)
+
+    def remove_word(self, word):
+        count = self.counts.get(word)
+        if (count is None):
+            return
+        if (count > 1):
+            self.counts[word] = count - 1
+            return
+        del self.counts[word]
+        for delete in self.edits(word):
+            words = self.deletes.get(delete)
+            if (words == word):
+                del self.deletes[delete]
+            elif (isinstance(words, tuple)):
+                rest = tuple(other for other in words if other != word)
+                self.deletes[delete] = rest if len(rest) > 1 else rest[0]
+
+    def load_words(self, words):
+        with self.lock:
+            self.counts = {}
+            self.deletes = {}
+            for word in words:
+                self.add_word(word)
+
+    def build(self):
+        def words():
+            table = Question.__table__
+            query = select([table.c.question, table.c.answer])
+            with db.engine.connect() as connection:
+                result = connection.execution_options(
+                    stream_results=True).execute(query)
+                for question, answer in result:
+                    yield from tokenize(question)
+                    yield from tokenize(answer)
+        self.load_words(words())
+
+    def ensure(self):
+        if (not self.ready):
+            with self.lock:
+                if (not self.ready):
+                    self.build()
+
+    def on_change(self, change_set):
+        with self.lock:
+            if (not self.ready):
+                return
+            if (change_set.reset):
+                self.counts = self.deletes = None
+                return
+
+            removed = list(change_set.deleted)
+            added = list(change_set.added)
+            for before, after in change_set.updated:
+                removed.append(before)
+                added.append(after)
+            for question in removed:
+                for word in (tokenize(question['question'])
+                             + tokenize(question['answer'])):
+                    self.remove_word(word)
+            for question in added:
+                for word in (tokenize(question['question'])
+                             + tokenize(question['answer'])):
+                    self.add_word(word)
+
+    '''
+    lookup(word)
+        the known word closest to word, the most frequent one among those
+        at the same distance; word itself when it is known or too short,
+        None when nothing is within max_distance
+    '''
+
+    def lookup(self, word):
+        with self.lock:
+            if (word in self.counts or len(word) < self.min_length
+                    or word.isdigit()):
+                return word
+
+            candidates = set()
+            for delete in self.edits(word):
+                words = self.deletes.get(delete)
+                if (isinstance(words, str)):
+                    candidates.add(words)
+                elif (words is not None):
+                    candidates.update(words)
+
+            best = None
+            for candidate in candidates:
+                distance = edit_distance(word, candidate, self.max_distance)
+                if (distance > self.max_distance):
+                    continue
+                rank = (distance, -self.counts[candidate], candidate)
+                if (best is None or rank < best):
+                    best = rank
+            return best[2] if best is not None else None
+
+    '''
+    suggest(term)
+        term with each unknown word replaced by its correction, or None
+        when no word could be corrected
+    '''
+
+    def suggest(self, term):
+        self.ensure()
+        words = tokenize(term)
+        corrected = [self.lookup(word) or word for word in words]
+        if (corrected == words):
+            return None
+        return ' '.join(corrected)
+
+    def stats(self):
+        if (not self.ready):
+            return {'ready': False}
+        return {
+            'ready': True,
+            'words': len(self.counts),
+            'deletes': len(self.deletes)
+        }
@@ -3,6 +3,7 @@ import unittest
 import json
 from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 
 from flaskr import create_app
 from models import setup_db, Question, Category
@@ -51,6 +52,66 @@ class TriviaTestCase(unittest.TestCase):
             data['total_questions'], len(
                 data['questions']))
 
+    # Test get_questions pages do not overlap
+
+    def test_get_questions_pages(self):
+        first = json.loads(self.client().get('/questions?page=1').data)
+        second = json.loads(self.client().get('/questions?page=2').data)
+
+        first_ids = [question['id'] for question in first['questions']]
+        second_ids = [question['id'] for question in second['questions']]
+
+        self.assertEqual(first['total_questions'], Question.query.count())
+        self.assertEqual(first_ids, sorted(first_ids))
+        self.assertLess(first_ids[-1], second_ids[0])
+
+    # Test get_questions cursor pagination walks the whole table
+
+    def test_get_questions_cursor(self):
+        data = json.loads(self.client().get('/questions?after_id=0').data)
+        ids = [question['id'] for question in data['questions']]
+
+        while data['next_cursor']:
+            res = self.client().get(
+                f"/questions?cursor={data['next_cursor']}")
+            data = json.loads(res.data)
+            ids += [question['id'] for question in data['questions']]
+
+        all_ids = [question.id for question in
+                   Question.query.order_by(Question.id).all()]
+        self.assertEqual(ids, all_ids)
+
+    # Test get_questions with a malformed cursor
+
+    def test_get_questions_cursor_422(self):
+        res = self.client().get('/questions?cursor=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
+    # Test get_questions with per_page and fields
+
+    def test_get_questions_projection(self):
+        res = self.client().get(
+            '/questions?per_page=3&fields=question&include=')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['questions']), 3)
+        self.assertEqual(
+            sorted(data['questions'][0].keys()), ['id', 'question'])
+        self.assertNotIn('categories', data)
+
+    # Test get_questions with an unknown field
+
+    def test_get_questions_projection_422(self):
+        res = self.client().get('/questions?fields=password')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
     # Test get_questions 404 error
 
     def test_get_questions_404(self):
@@ -77,6 +138,105 @@ class TriviaTestCase(unittest.TestCase):
         self.assertNotEqual(data['categories'], [])
         self.assertIsInstance(data['total_categories'], int)
 
+    # test get_categories is served from the category cache
+
+    def test_get_categories_cached(self):
+        self.client().get('/categories')
+        self.client().get('/categories')
+        res = self.client().get('/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertGreaterEqual(data['category_cache']['hits'], 1)
+
+    # test the category cache is dropped when a category is written
+
+    def test_get_categories_invalidated(self):
+        self.client().get('/categories')
+
+        with self.app.app_context():
+            category = Category(type='CATEGORY')
+            self.db.session.add(category)
+            self.db.session.commit()
+            category_id = category.id
+
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            self.db.session.query(Category).filter_by(
+                id=category_id).delete()
+            self.db.session.commit()
+
+        self.assertEqual(data['categories'][str(category_id)], 'CATEGORY')
+
+    # test get_categories answers 304 while nothing changed
+
+    def test_get_categories_304(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get(
+            '/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    # test another worker hands out the same ETag for the same data
+
+    def test_get_categories_etag_shared(self):
+        etag = self.client().get('/categories').headers['ETag']
+
+        other = create_app()
+        setup_db(other, self.database_path)
+        res = other.test_client().get(
+            '/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+
+    # ======================= #
+    #    EXPORT QUESTIONS     #
+    # ======================= #
+
+    # Test get_questions_export as ndjson
+
+    def test_get_questions_export(self):
+        res = self.client().get('/questions/export')
+        rows = [json.loads(line) for line in res.data.splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(rows), Question.query.count())
+        self.assertEqual(rows[0]['category_type'],
+                         Category.query.get(rows[0]['category']).type)
+
+    # Test get_questions_export as csv
+
+    def test_get_questions_export_csv(self):
+        res = self.client().get('/questions/export?format=csv')
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(lines[0].startswith('id,question,answer'))
+        self.assertEqual(len(lines) - 1, Question.query.count())
+
+    # Test post_questions_import with one bad row
+
+    def test_post_questions_import(self):
+        body = '\n'.join([
+            json.dumps(dict(self.new_trivia, category='Science')),
+            json.dumps(dict(self.new_trivia, category='Nowhere'))])
+        res = self.client().post(
+            '/questions/import?format=ndjson', data=body,
+            content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['imported'], 1)
+        self.assertEqual(data['rejected'], 1)
+        self.assertEqual(data['errors'][0]['line'], 2)
+        self.assertEqual(
+            Question.query.filter_by(question='QUESTION').one().category, 1)
+
     # ======================= #
     #    DELETE QUESTION      #
     # ======================= #
@@ -115,6 +275,49 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['deleted_id'], trivia_temp.id)
         self.assertFalse(is_id_still_present, False)
 
+    # Test post_questions_batch deletes and reassigns in one call
+
+    def test_post_questions_batch(self):
+        with self.app.app_context():
+            trivia = Question(
+                question='QUESTION',
+                answer='ANSWER',
+                difficulty=1,
+                category=1
+            )
+            doomed = Question(
+                question='QUESTION TO DELETE',
+                answer='ANSWER',
+                difficulty=1,
+                category=1
+            )
+            self.db.session.add_all([trivia, doomed])
+            self.db.session.commit()
+            trivia_id, doomed_id = trivia.id, doomed.id
+
+        res = self.client().post('/questions/batch', json={
+            'delete': [doomed_id, 999999],
+            'reassign': [{'id': trivia_id, 'category': 2}]
+        })
+        data = json.loads(res.data)
+        outcomes = [result['outcome'] for result in data['results']]
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(outcomes, ['deleted', 'not_found', 'reassigned'])
+        self.assertEqual(data['deleted'], 1)
+        self.assertEqual(data['total_questions'], Question.query.count())
+        self.assertIsNone(Question.query.get(doomed_id))
+        self.assertEqual(Question.query.get(trivia_id).category, 2)
+
+        # an id repeated in delete is refused, like one reassigned twice
+        res = self.client().post('/questions/batch', json={
+            'delete': [trivia_id, trivia_id]
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['error'], 422)
+        self.assertIsNotNone(Question.query.get(trivia_id))
+
     # Test delete_question_404
 
     def test_delete_question_404(self):
@@ -143,6 +346,46 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(new_trivia)
 
+    # Test post_question and delete_question keep the totals in step
+
+    def test_post_delete_question_totals(self):
+        before = json.loads(self.client().get('/questions').data)
+
+        res = self.client().post('/questions', json=(self.new_trivia))
+        posted = json.loads(res.data)
+        trivia_id = Question.query.filter_by(question='QUESTION').one().id
+
+        res = self.client().delete(f'/questions/{trivia_id}')
+        deleted = json.loads(res.data)
+
+        self.assertEqual(
+            posted['total_questions'], before['total_questions'] + 1)
+        self.assertEqual(
+            deleted['total_questions'], before['total_questions'])
+        self.assertEqual(deleted['total_questions'], Question.query.count())
+
+    # Test post_question changes the ETag of the question list
+
+    def test_post_question_etag(self):
+        etag = self.client().get('/questions').headers['ETag']
+
+        self.client().post('/questions', json=(self.new_trivia))
+        res = self.client().get(
+            '/questions', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    # Test post_question with a malformed body
+
+    def test_post_question_422(self):
+        trivia = dict(self.new_trivia, category='not-a-category')
+        res = self.client().post('/questions', json=trivia)
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
     # ======================= #
     #     SEARCH QUESTIONS    #
     # ======================= #
@@ -171,6 +414,128 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['total_questions'], 1)
         self.assertEqual(data['questions'][0]['answer'], 'ANSWER')
 
+    # Test search_question in fulltext mode matches the answer text
+
+    def test_search_question_fulltext(self):
+        self.client().post('/questions', json=(self.new_trivia))
+
+        res = self.client().post('/question', json={
+            "searchTerm": "answer", "mode": "fulltext", "highlight": True})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions'][0]['question'], 'QUESTION')
+        self.assertIn('<b>', data['questions'][0]['headline']['answer'])
+
+    # Test search_question in fuzzy mode tolerates a misspelling
+
+    def test_search_question_fuzzy(self):
+        self.client().post('/questions', json=dict(
+            self.new_trivia, answer='Penicillin'))
+
+        res = self.client().post('/question', json={
+            "searchTerm": "penicilin", "mode": "fuzzy", "threshold": 0.5})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertIn('Penicillin', [
+            question['answer'] for question in data['questions']])
+
+    # Test search_question from the in-memory index follows writes
+
+    def test_search_question_index(self):
+        self.client().post('/question', json={
+            "searchTerm": "lake", "mode": "index"})
+        self.client().post('/questions', json=dict(
+            self.new_trivia, answer='Lake Titicaca'))
+
+        res = self.client().post('/question', json={
+            "searchTerm": "tITIC qu", "mode": "index"})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['answer'], 'Lake Titicaca')
+
+    # Test search_question with an unknown mode
+
+    def test_search_question_mode_422(self):
+        res = self.client().post('/question', json={
+            "searchTerm": "QUEST", "mode": "telepathy"})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
+    # Test search_question is not served stale from the response cache
+
+    def test_search_question_cache_invalidated(self):
+        self.client().post('/questions', json=(self.new_trivia))
+        trivia_id = Question.query.filter_by(question='QUESTION').one().id
+
+        self.client().post('/question', json={"searchTerm": "quest"})
+        res = self.client().post('/question', json={"searchTerm": "Quest"})
+        found = json.loads(res.data)
+        stats = json.loads(self.client().get('/stats').data)
+
+        self.client().delete(f'/questions/{trivia_id}')
+        res = self.client().post('/question', json={"searchTerm": "Quest"})
+        data = json.loads(res.data)
+
+        self.assertEqual(found['total_questions'], 1)
+        self.assertGreaterEqual(stats['response_cache']['hits'], 1)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+
+    # Test search_question returns one page and a bounded total
+
+    def test_search_question_paged(self):
+        self.app.config['SEARCH_COUNT_LIMIT'] = 3
+        res = self.client().post('/question', json={
+            "searchTerm": "a", "per_page": 2})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['questions']), 2)
+        self.assertEqual(data['total_questions'], 3)
+        self.assertEqual(data['total_exact'], False)
+        self.assertTrue(data['next_cursor'])
+
+    # Test get_autocomplete suggests questions and answers by prefix
+
+    def test_get_autocomplete(self):
+        self.client().get('/questions/autocomplete?q=x')
+        self.client().post('/questions', json=dict(
+            self.new_trivia, answer='Quester'))
+
+        res = self.client().get('/questions/autocomplete?q=quest&limit=5')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertIn('QUESTION', [
+            question['question'] for question in data['questions']])
+        self.assertIn('Quester', data['answers'])
+
+    # Test search_question facets and filters
+
+    def test_search_question_facets(self):
+        self.client().post('/questions', json=(self.new_trivia))
+        self.client().post('/questions', json=dict(
+            self.new_trivia, question='QUESTION TWO', category=2))
+        two = Question.query.filter_by(question='QUESTION TWO').one()
+
+        res = self.client().post('/question', json={
+            "searchTerm": "QUESTION", "category": 2, "include": "facets"})
+        data = json.loads(res.data)
+
+        self.client().delete(f'/questions/{two.id}')
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['question'], 'QUESTION TWO')
+        self.assertEqual(data['facets']['category'], {'1': 1, '2': 1})
+        self.assertEqual(data['facets']['difficulty'], {'1': 1})
+
     # Test search_question_not_found
 
     def test_search_question_not_found(self):
@@ -196,6 +561,19 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['error'], 404)
 
+    # Test search_question suggests a correction when nothing is found
+
+    def test_search_question_did_you_mean(self):
+        self.client().post('/questions', json=dict(
+            self.new_trivia, answer='Questionable'))
+        res = self.client().post(
+            '/question', json={"searchTerm": "questionabel"})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+        self.assertEqual(data['did_you_mean'], 'questionable')
+
     # ======================= #
     #  GET QUESTIONS BY CAT.  #
     # ======================= #
@@ -222,6 +600,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['current_category'], 'Science')
         self.assertNotEqual(data['categories'], {})
 
+    # Test get_questions_by_category total counts the whole category
+
+    def test_get_questions_by_category_total(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(
+            data['total_questions'],
+            Question.query.filter_by(category=1).count())
+
     # Test get_random_quesiton
 
     # Case with no previous question
@@ -250,7 +638,9 @@ class TriviaTestCase(unittest.TestCase):
                 'id': 1,
                 'type': 'Science'
             },
-            'previous_questions': ['q1', 'q2', 'q3']
+            'previous_questions': [
+                question.id for question in
+                Question.query.filter_by(category=1).all()]
         })
 
         data = json.loads(res.data)
@@ -261,6 +651,318 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['question'], False)
         self.assertEqual(data['current_category'], 1)
 
+    # Case drawing a whole category: every question once, then False
+
+    def test_get_random_question_unseen(self):
+        previous = []
+        while (True):
+            res = self.client().post('/quizzes', json={
+                'quiz_category': {'id': 1, 'type': 'Science'},
+                'previous_questions': previous
+            })
+            data = json.loads(res.data)
+            if (data['question'] is False):
+                break
+            self.assertNotIn(data['question']['id'], previous)
+            previous.append(data['question']['id'])
+
+        self.assertEqual(
+            sorted(previous),
+            sorted(question.id for question in
+                   Question.query.filter_by(category=1).all()))
+
+    # Case a question deleted through another worker: the pools do not
+    # know, so its id is dropped when its row is missing and another drawn
+
+    def test_get_random_question_deleted_elsewhere(self):
+        self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'previous_questions': []
+        })
+        with self.app.app_context():
+            question = Question(**self.new_trivia)
+            self.db.session.add(question)
+            self.db.session.commit()
+            question_id = question.id
+            others = [other.id for other in
+                      Question.query.filter_by(category=1).all()
+                      if other.id != question_id]
+            self.db.engine.execute(text(
+                'DELETE FROM questions WHERE id = :id'), id=question_id)
+
+        kept = others.pop()
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'previous_questions': others
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['id'], kept)
+
+    # Case ALL categories (id 0) and a list of categories
+
+    def test_get_random_question_all(self):
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 0, 'type': 'click'},
+            'previous_questions': []
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['current_category'], 0)
+        self.assertTrue(data['question'])
+
+        res = self.client().post('/quizzes', json={
+            'quiz_categories': [1, 2],
+            'weights': {'1': 0, '2': 1},
+            'previous_questions': []
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['current_category'], [1, 2])
+        self.assertEqual(data['question']['category'], 2)
+
+    # Case prefetching a round of questions in one call
+
+    def test_get_random_question_count(self):
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 0, 'type': 'click'},
+            'previous_questions': [],
+            'count': 5
+        })
+        data = json.loads(res.data)
+        ids = [question['id'] for question in data['questions']]
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(data['question']['id'], ids[0])
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'previous_questions': [],
+            'count': 0
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
+    # Case drawing in the database (QUIZ_SAMPLING = 'database')
+
+    def test_get_random_question_database(self):
+        self.app.config['QUIZ_SAMPLING'] = 'database'
+        ids = [question.id for question in
+               Question.query.filter_by(category=1).all()]
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'previous_questions': ids[1:],
+            'count': 5
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(
+            [question['id'] for question in data['questions']], ids[:1])
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'previous_questions': ids
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['question'], False)
+
+    # Case sending the seen token instead of previous_questions
+
+    def test_get_random_question_seen(self):
+        self.app.config['SECRET_KEY'] = 'test'
+        total = Question.query.filter_by(category=1).count()
+        seen = ''
+        drawn = []
+        for _ in range(total + 1):
+            res = self.client().post('/quizzes', json={
+                'quiz_category': {'id': 1, 'type': 'Science'},
+                'seen': seen
+            })
+            data = json.loads(res.data)
+            seen = data['seen']
+            if (data['question']):
+                drawn.append(data['question']['id'])
+
+        self.assertEqual(data['question'], False)
+        self.assertEqual(len(set(drawn)), total)
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'seen': seen[:-1]
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
+    def test_get_random_question_seen_limit(self):
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'seen': '',
+            'previous_questions': [1000000000]
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
+    # Case leaning toward a difficulty that follows the answers
+
+    def test_get_random_question_difficulty(self):
+        science = Question.query.filter_by(category=1).all()
+        hardest = [question.id for question in science
+                   if question.difficulty == 4]
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'previous_questions': hardest,
+            'difficulty': 4.5,
+            'correct': True
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['difficulty'], 5)
+        self.assertEqual(data['question']['difficulty'], 3)
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'previous_questions': [],
+            'difficulty': 1,
+            'correct': False
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data['difficulty'], 1)
+
+    # Test grade_answer forgives case, articles and small typos
+
+    def test_grade_answer(self):
+        # the keys are built first, the new question's come with its commit
+        res = self.client().post('/questions/0/answer', json={'answer': 'x'})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['error'], 404)
+
+        self.client().post('/questions', json=dict(
+            self.new_trivia, answer='The Palace of Versailles'))
+        question = Question.query.filter_by(question='QUESTION').first()
+
+        results = [json.loads(self.client().post(
+            f'/questions/{question.id}/answer', json={'answer': guess}).data)
+            for guess in ('palace of versailles', 'Palace of Versaille',
+                          'Louvre')]
+
+        self.assertEqual([result['correct'] for result in results],
+                         [True, True, False])
+        self.assertEqual([result['exact'] for result in results],
+                         [True, False, False])
+        self.assertEqual(results[0]['answer'], 'The Palace of Versailles')
+
+    # Case a question created through another worker: its row is looked
+    # up when it has no keys
+
+    def test_grade_answer_created_elsewhere(self):
+        self.client().post('/questions/0/answer', json={'answer': 'x'})
+        with self.app.app_context():
+            self.db.engine.execute(text(
+                'INSERT INTO questions (question, answer, category, '
+                'difficulty) VALUES (:question, :answer, 1, 1)'),
+                question='QUESTION', answer='ANSWER')
+            question = Question.query.filter_by(question='QUESTION').first()
+
+        res = self.client().post(
+            f'/questions/{question.id}/answer', json={'answer': 'answer'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['correct'], True)
+
+    # Case numbers have to match exactly, only words may have typos
+
+    def test_grade_answer_numbers(self):
+        self.client().post('/questions', json=dict(
+            self.new_trivia, answer='Apollo 13'))
+        question = Question.query.filter_by(question='QUESTION').first()
+
+        grades = [json.loads(self.client().post(
+            f'/questions/{question.id}/answer',
+            json={'answer': guess}).data)['correct']
+            for guess in ('Apollo 11', 'Apolo 13', '1930')]
+
+        self.assertEqual(grades, [False, True, False])
+
+    # Case answers with "/" or "or" in them are not split into keys
+
+    def test_grade_answer_alternatives(self):
+        self.client().post('/questions', json=dict(
+            self.new_trivia, answer='AC/DC'))
+        self.client().post('/questions', json=dict(
+            self.new_trivia, question='QUESTION TWO',
+            answer='Trick or Treat'))
+        question = Question.query.filter_by(question='QUESTION').first()
+        two = Question.query.filter_by(question='QUESTION TWO').one()
+
+        grades = [json.loads(self.client().post(
+            f'/questions/{question_id}/answer',
+            json={'answer': guess}).data)['correct']
+            for question_id, guess in (
+                (question.id, 'DC'), (question.id, 'ac/dc'),
+                (two.id, 'treat'), (two.id, 'trick or treat'))]
+
+        self.client().delete(f'/questions/{two.id}')
+
+        self.assertEqual(grades, [False, True, False, True])
+
+    # Test quiz sessions deal the category once and draw it card by card
+
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': {'id': 1, 'type': 'Science'}})
+        data = json.loads(res.data)
+        session_id = data['session_id']
+
+        self.assertEqual(data['success'], True)
+        self.assertEqual(
+            data['total_questions'],
+            Question.query.filter_by(category=1).count())
+
+        drawn = []
+        for _ in range(data['total_questions']):
+            data = json.loads(self.client().post(
+                f'/quizzes/sessions/{session_id}/next').data)
+            drawn.append(data['question']['id'])
+        data = json.loads(self.client().post(
+            f'/quizzes/sessions/{session_id}/next').data)
+
+        self.assertEqual(data['question'], False)
+        self.assertEqual(data['remaining'], 0)
+        self.assertEqual(len(set(drawn)), len(drawn))
+
+    def test_quiz_session_deck_size(self):
+        self.app.config['MAX_QUIZ_DECK_SIZE'] = 4
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': {'id': 0, 'type': 'click'},
+            'questions': 1000})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['total_questions'], 4)
+
+    def test_quiz_session_404(self):
+        res = self.client().post('/quizzes/sessions/missing/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+
     def tearDown(self):
         with self.app.app_context():
 
@@ -0,0 +1,420 @@
+import array
+import bisect
+import hashlib
+import os
+import pickle
+import re
+import threading
+
+from sqlalchemy import select, text
+
+import changes
+from models import Question, db
+
+'''
+textindex
+    in-memory indexes over the question and answer texts: an inverted index
+    for searching on databases without full-text extensions, and a sorted
+    prefix index for autocomplete
+'''
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+INDEX_FORMAT = 3
+
+# a digest of every row the index depends on, computed by postgres so the
+# rows do not travel
+FINGERPRINT = text(
+    "SELECT count(*), md5(coalesce(string_agg(concat_ws(':', id, "
+    "coalesce(category::text, '-'), coalesce(difficulty::text, '-'), "
+    "md5(concat(question, chr(31), answer))), ',' ORDER BY id), '')) "
+    "FROM questions")
+
+
+def tokenize(text):
+    return TOKEN.findall((text or '').casefold())
+
+
+def question_tokens(question):
+    return set(tokenize(question['question']) + tokenize(question['answer']))
+
+
+def intersect(left, right):
+    # both sorted: walk the shorter one and bisect into the longer one
+    if (len(left) > len(right)):
+        left, right = right, left
+    result = array.array('i')
+    position = 0
+    for value in left:
+        position = bisect.bisect_left(right, value, position)
+        if (position == len(right)):
+            break
+        if (right[position] == value):
+            result.append(value)
+    return result
+
+
+def union(postings):
+    if (len(postings) == 1):
+        return postings[0]
+    return array.array('i', sorted(set().union(*postings)))
+
+
+'''
+InvertedIndex
+    token -> sorted array of the ids of the questions containing it. The
+    arrays hold 4 byte ints, and the sorted vocabulary lets a query token
+    match every word it is a prefix of. attributes maps each id to its
+    (category, difficulty) for filtering and facets without SQL. Kept in
+    step with committed writes once built; a bulk change drops it and the
+    next search rebuilds it.
+
+    source is the fingerprint() of the rows the postings were built or
+    loaded from. A snapshot is only saved while that still describes them:
+    once a write has been applied there is no fingerprint of the postings,
+    and the fingerprint of the database at save time would also certify
+    rows written by other processes that the index never saw.
+'''
+
+
+class InvertedIndex:
+
+    def __init__(self, path=None):
+        self.path = path
+        self.postings = None
+        self.attributes = None
+        self.vocabulary = []
+        self.source = None
+        self.lock = threading.RLock()
+        changes.subscribe(self.on_change)
+
+    @property
+    def ready(self):
+        return self.postings is not None
+
+    def build(self):
+        postings = {}
+        attributes = {}
+        # taken first: a row written while the index reads can only make
+        # the snapshot look older than it is
+        source = self.fingerprint()
+        questions = Question.__table__
+        query = select([
+            questions.c.id, questions.c.question, questions.c.answer,
+            questions.c.category, questions.c.difficulty]).order_by(
+            questions.c.id)
+        with db.engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True).execute(query)
+            for question_id, question, answer, category, difficulty in (
+                    result):
+                attributes[question_id] = (category, difficulty)
+                # rows come in id order, so appending keeps arrays sorted
+                for token in set(tokenize(question) + tokenize(answer)):
+                    if (token not in postings):
+                        postings[token] = array.array('i')
+                    postings[token].append(question_id)
+
+        with self.lock:
+            self.postings = postings
+            self.attributes = attributes
+            self.vocabulary = sorted(postings)
+            self.source = source
+
+    def ensure(self):
+        if (not self.ready):
+            with self.lock:
+                if (not self.ready and not self.load()):
+                    self.build()
+                    self.save()
+
+    def fingerprint(self):
+        # changes with any id, text, category or difficulty, whoever wrote
+        # it; other databases hash the rows here
+        if (db.engine.dialect.name == 'postgresql'):
+            return tuple(db.session.execute(FINGERPRINT).fetchone())
+
+        digest = hashlib.md5()
+        count = 0
+        questions = Question.__table__
+        query = select([
+            questions.c.id, questions.c.category, questions.c.difficulty,
+            questions.c.question, questions.c.answer]).order_by(
+            questions.c.id)
+        with db.engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True).execute(query)
+            for row in result:
+                digest.update(repr(tuple(row)).encode('utf-8'))
+                count += 1
+        return count, digest.hexdigest()
+
+    def save(self):
+        if (self.path is None or not self.ready):
+            return
+        with self.lock:
+            if (self.source is None):
+                return
+            state = {
+                'format': INDEX_FORMAT,
+                'fingerprint': self.source,
+                'postings': self.postings,
+                'attributes': self.attributes
+            }
+            temporary = self.path + '.tmp'
+            with open(temporary, 'wb') as snapshot:
+                pickle.dump(state, snapshot, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path)
+
+    def load(self):
+        # a snapshot is used only when the rows still have the fingerprint
+        # they had when it was saved
+        if (self.path is None or not os.path.exists(self.path)):
+            return False
+        try:
+            with open(self.path, 'rb') as snapshot:
+                state = pickle.load(snapshot)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        source = self.fingerprint()
+        if (state.get('format') != INDEX_FORMAT
+                or state.get('fingerprint') != source):
+            return False
+
+        with self.lock:
+            self.postings = state['postings']
+            self.attributes = state['attributes']
+            self.vocabulary = sorted(self.postings)
+            self.source = source
+        return True
+
+    def add(self, question):
+        question_id = question['id']
+        self.attributes[question_id] = (
+            question['category'], question['difficulty'])
+        for token in question_tokens(question):
+            posting = self.postings.get(token)
+            if (posting is None):
+                self.postings[token] = array.array('i', [question_id])
+                bisect.insort(self.vocabulary, token)
+                continue
+            position = bisect.bisect_left(posting, question_id)
+            if (position == len(posting) or posting[position] != question_id):
+                posting.insert(position, question_id)
+
+    def remove(self, question):
+        question_id = question['id']
+        self.attributes.pop(question_id, None)
+        for token in question_tokens(question):
+            posting = self.postings.get(token)
+            if (posting is None):
+                continue
+            position = bisect.bisect_left(posting, question_id)
+            if (position < len(posting) and posting[position] == question_id):
+                del posting[position]
+            if (not posting):
+                del self.postings[token]
+                del self.vocabulary[
+                    bisect.bisect_left(self.vocabulary, token)]
+
+    def on_change(self, change_set):
+        with self.lock:
+            if (not self.ready):
+                return
+            if (change_set.reset):
+                self.postings = self.attributes = None
+                self.vocabulary = []
+                self.source = None
+                return
+
+            if (change_set.added or change_set.deleted
+                    or change_set.updated):
+                self.source = None
+            for question in change_set.deleted:
+                self.remove(question)
+            for before, after in change_set.updated:
+                self.remove(before)
+                self.add(after)
+            for question in change_set.added:
+                self.add(question)
+
+    def matching(self, prefix):
+        # the postings of every word starting with prefix
+        position = bisect.bisect_left(self.vocabulary, prefix)
+        postings = []
+        while (position < len(self.vocabulary)
+               and self.vocabulary[position].startswith(prefix)):
+            postings.append(self.postings[self.vocabulary[position]])
+            position += 1
+        return postings
+
+    '''
+    search(term)
+        sorted ids of the questions in which every word of term starts a
+        word of the question or answer text
+    '''
+
+    def search(self, term):
+        self.ensure()
+        tokens = sorted(set(tokenize(term)), key=len, reverse=True)
+        if (not tokens):
+            return array.array('i')
+
+        with self.lock:
+            result = None
+            for token in tokens:
+                postings = self.matching(token)
+                if (not postings):
+                    return array.array('i')
+                matched = union(postings)
+                result = matched if result is None else intersect(
+                    result, matched)
+                if (not result):
+                    break
+            return array.array('i', result)
+
+    def stats(self):
+        if (not self.ready):
+            return {'ready': False}
+        return {
+            'ready': True,
+            'tokens': len(self.postings),
+            'postings': sum(len(posting)
+                            for posting in self.postings.values())
+        }
+
+
+def prefix_key(text):
+    return ' '.join((text or '').casefold().split())
+
+
+'''
+PrefixIndex
+    the question and answer texts sorted by their normalized form
+    (casefolded, whitespace collapsed), so every entry starting with a
+    typed prefix is one contiguous run found by bisection. Answers are kept
+    once per distinct text, with a count of the questions using them.
+    Follows committed writes like InvertedIndex.
+'''
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self.questions = None
+        self.answers = None
+        self.answer_counts = None
+        self.lock = threading.RLock()
+        changes.subscribe(self.on_change)
+
+    @property
+    def ready(self):
+        return self.questions is not None
+
+    def build(self):
+        questions = []
+        answer_counts = {}
+        answers = {}
+        table = Question.__table__
+        query = select([table.c.id, table.c.question, table.c.answer])
+        with db.engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True).execute(query)
+            for question_id, question, answer in result:
+                questions.append((prefix_key(question), question_id,
+                                  question))
+                key = prefix_key(answer)
+                answer_counts[key] = answer_counts.get(key, 0) + 1
+                answers.setdefault(key, answer)
+
+        with self.lock:
+            self.questions = sorted(questions)
+            self.answers = sorted(answers.items())
+            self.answer_counts = answer_counts
+
+    def ensure(self):
+        if (not self.ready):
+            with self.lock:
+                if (not self.ready):
+                    self.build()
+
+    def add(self, question):
+        bisect.insort(self.questions, (
+            prefix_key(question['question']), question['id'],
+            question['question']))
+        key = prefix_key(question['answer'])
+        count = self.answer_counts.get(key, 0)
+        self.answer_counts[key] = count + 1
+        if (count == 0):
+            bisect.insort(self.answers, (key, question['answer']))
+
+    def remove(self, question):
+        entry = (prefix_key(question['question']), question['id'],
+                 question['question'])
+        position = bisect.bisect_left(self.questions, entry)
+        if (position < len(self.questions)
+                and self.questions[position] == entry):
+            del self.questions[position]
+
+        key = prefix_key(question['answer'])
+        count = self.answer_counts.get(key, 0)
+        if (count <= 1):
+            self.answer_counts.pop(key, None)
+            position = bisect.bisect_left(self.answers, (key,))
+            if (position < len(self.answers)
+                    and self.answers[position][0] == key):
+                del self.answers[position]
+        else:
+            self.answer_counts[key] = count - 1
+
+    def on_change(self, change_set):
+        with self.lock:
+            if (not self.ready):
+                return
+            if (change_set.reset):
+                self.questions = self.answers = self.answer_counts = None
+                return
+
+            for question in change_set.deleted:
+                self.remove(question)
+            for before, after in change_set.updated:
+                self.remove(before)
+                self.add(after)
+            for question in change_set.added:
+                self.add(question)
+
+    '''
+    complete(prefix, limit)
+        up to limit questions ({'id', 'question'}) and limit distinct
+        answers whose text starts with prefix, in alphabetical order
+    '''
+
+    def complete(self, prefix, limit):
+        self.ensure()
+        key = prefix_key(prefix)
+        if (not key):
+            return [], []
+
+        with self.lock:
+            start = bisect.bisect_left(self.questions, (key,))
+            questions = []
+            for entry in self.questions[start:start + limit]:
+                if (not entry[0].startswith(key)):
+                    break
+                questions.append({'id': entry[1], 'question': entry[2]})
+
+            start = bisect.bisect_left(self.answers, (key,))
+            answers = []
+            for entry in self.answers[start:start + limit]:
+                if (not entry[0].startswith(key)):
+                    break
+                answers.append(entry[1])
+        return questions, answers
+
+    def stats(self):
+        if (not self.ready):
+            return {'ready': False}
+        return {
+            'ready': True,
+            'questions': len(self.questions),
+            'answers': len(self.answers)
+        }
@@ -0,0 +1,343 @@
+import csv
+import io
+import json
+import re
+import time
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+
+import changes
+from caches import bump_revisions
+from models import Question, Category
+
+'''
+transfer
+    moving the question bank in and out in bulk, for the export endpoint
+    and the flask CLI commands
+'''
+
+EXPORT_COLUMNS = ('id', 'question', 'answer', 'difficulty', 'category',
+                  'category_type')
+
+
+'''
+export_questions(engine)
+    yields every question, joined with its category name, in id order.
+    The rows come from one SELECT on a dedicated connection, read through a
+    server-side cursor (stream_results) chunk_size rows at a time, so memory
+    stays flat whatever the size of the bank. A single statement already
+    sees a single snapshot; on postgres the transaction is also REPEATABLE
+    READ, READ ONLY to make that explicit.
+'''
+
+
+def export_questions(engine, chunk_size=1000):
+    questions = Question.__table__
+    categories = Category.__table__
+    query = select([
+        questions.c.id,
+        questions.c.question,
+        questions.c.answer,
+        questions.c.difficulty,
+        questions.c.category,
+        categories.c.type.label('category_type')
+    ]).select_from(questions.outerjoin(
+        categories, questions.c.category == categories.c.id)).order_by(
+        questions.c.id)
+
+    options = {}
+    if (engine.dialect.name == 'postgresql'):
+        options['isolation_level'] = 'REPEATABLE READ'
+
+    with engine.connect() as connection:
+        connection = connection.execution_options(**options)
+        with connection.begin():
+            # only the SELECT streams: psycopg2 would wrap the SET in a
+            # server-side cursor too, which postgres rejects
+            if (engine.dialect.name == 'postgresql'):
+                connection.execute('SET TRANSACTION READ ONLY')
+            result = connection.execution_options(
+                stream_results=True).execute(query)
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if (not rows):
+                    break
+                for row in rows:
+                    yield row
+
+
+def to_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n'
+
+
+def to_csv(rows, chunk_size=1000):
+    # rows are written to a small buffer that is flushed every chunk_size
+    # rows, so the stream is not one write call per row
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if (count % chunk_size == 0):
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'ndjson': (to_ndjson, 'application/x-ndjson'),
+    'csv': (to_csv, 'text/csv')
+}
+
+
+'''
+import parsers
+    each turns an iterable of text lines into (line_number, row) pairs,
+    row being a dict of the columns found on that line, or an error message
+    when the line cannot be read at all.
+
+    copy reads the tab separated text format of COPY ... FROM stdin, as in
+    trivia.psql: a whole dump can be given, only the questions block is
+    used. Without a COPY header the columns are those of trivia.psql.
+'''
+
+COPY_COLUMNS = ('id', 'question', 'answer', 'difficulty', 'category')
+COPY_HEADER = re.compile(
+    r'^COPY\s+(?:\w+\.)?(\w+)\s*\(([^)]*)\)\s+FROM\s+stdin;', re.I)
+COPY_ESCAPE = re.compile(r'\\(.)')
+COPY_UNESCAPE = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t',
+                 'v': '\v'}
+
+
+def parse_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        if (not line.strip()):
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, 'invalid JSON: %s' % error
+            continue
+        if (not isinstance(row, dict)):
+            yield number, 'expected a JSON object'
+        else:
+            yield number, row
+
+
+def parse_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_copy(lines):
+    columns = COPY_COLUMNS
+    in_block = None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\n').rstrip('\r')
+        header = COPY_HEADER.match(line)
+        if (header):
+            in_block = header.group(1) == 'questions'
+            columns = tuple(column.strip()
+                            for column in header.group(2).split(','))
+            continue
+        if (line == '\\.'):
+            in_block = False
+            continue
+        if (in_block is False or (in_block is None and not line)):
+            continue
+        if (in_block is None and '\t' not in line):
+            # the statements of a dump around the COPY blocks
+            continue
+
+        values = line.split('\t')
+        if (len(values) != len(columns)):
+            yield number, 'expected %d columns, found %d' % (
+                len(columns), len(values))
+            continue
+        yield number, {
+            column: None if value == '\\N' else COPY_ESCAPE.sub(
+                lambda match: COPY_UNESCAPE.get(
+                    match.group(1), match.group(1)), value)
+            for column, value in zip(columns, values)}
+
+
+IMPORT_FORMATS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv,
+    'copy': parse_copy
+}
+
+
+def copy_text(value):
+    if (value is None):
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+'''
+ImportReport
+    outcome of import_questions(): rows loaded and rejected, the first
+    max_errors problems as {'line' or 'chunk', 'error'} and the throughput
+'''
+
+
+class ImportReport:
+
+    def __init__(self, max_errors=100):
+        self.imported = 0
+        self.rejected = 0
+        self.chunks = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.started = time.perf_counter()
+        self.seconds = 0
+
+    def error(self, **error):
+        if (len(self.errors) < self.max_errors):
+            self.errors.append(error)
+
+    def format(self):
+        return {
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'chunks': self.chunks,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(
+                self.imported / self.seconds) if self.seconds else None,
+            'errors': self.errors
+        }
+
+
+'''
+import_questions(engine, parsed)
+    validates the rows of one of the parsers above and loads them chunk_size
+    at a time, each chunk in its own transaction: COPY on postgres, an
+    executemany INSERT elsewhere. Categories may be given by id or by name;
+    names are resolved against one read of the categories table. Incoming
+    ids are ignored, the questions get new ones.
+
+    A chunk the database refuses is rolled back and reported as a whole;
+    the chunks before it stay loaded. The bank revisions are bumped and
+    subscribers of changes told once at the end that the bank was reloaded.
+'''
+
+
+def import_questions(engine, parsed, chunk_size=5000, max_errors=100):
+    report = ImportReport(max_errors)
+    categories = Category.__table__
+    with engine.connect() as connection:
+        known = connection.execute(
+            select([categories.c.id, categories.c.type])).fetchall()
+    ids = set(category_id for category_id, name in known)
+    names = {(name or '').strip().lower(): category_id
+             for category_id, name in known}
+
+    chunk = []
+    first_line = None
+    try:
+        for number, row in parsed:
+            if (not isinstance(row, dict)):
+                report.rejected += 1
+                report.error(line=number, error=row)
+                continue
+            try:
+                chunk.append(validate_row(row, ids, names))
+            except ValueError as error:
+                report.rejected += 1
+                report.error(line=number, error=str(error))
+                continue
+
+            if (first_line is None):
+                first_line = number
+            if (len(chunk) == chunk_size):
+                load_chunk(engine, chunk, first_line, report)
+                chunk = []
+                first_line = None
+        if (chunk):
+            load_chunk(engine, chunk, first_line, report)
+    finally:
+        report.seconds = time.perf_counter() - report.started
+        if (report.imported):
+            change_set = changes.ChangeSet()
+            change_set.reset = True
+            with engine.begin() as connection:
+                bump_revisions(connection, change_set)
+            changes.notify(change_set)
+
+    return report
+
+
+def validate_row(row, ids, names):
+    question = row.get('question')
+    answer = row.get('answer')
+    if (not isinstance(question, str) or not question.strip()):
+        raise ValueError('question is missing')
+    if (not isinstance(answer, str) or not answer.strip()):
+        raise ValueError('answer is missing')
+
+    try:
+        difficulty = int(row.get('difficulty'))
+    except (TypeError, ValueError):
+        raise ValueError('difficulty must be an integer')
+
+    category = row.get('category')
+    if (isinstance(category, str) and not category.strip().isdigit()):
+        category = names.get(category.strip().lower())
+    else:
+        try:
+            category = int(category)
+        except (TypeError, ValueError):
+            category = None
+    if (category not in ids):
+        raise ValueError('unknown category %r' % (row.get('category'),))
+
+    return {
+        'question': question,
+        'answer': answer,
+        'difficulty': difficulty,
+        'category': category
+    }
+
+
+def load_chunk(engine, chunk, first_line, report):
+    try:
+        if (engine.dialect.name == 'postgresql'):
+            copy_chunk(engine, chunk)
+        else:
+            with engine.begin() as connection:
+                connection.execute(Question.__table__.insert(), chunk)
+    except (DBAPIError, engine.dialect.dbapi.Error) as error:
+        report.rejected += len(chunk)
+        report.error(chunk=report.chunks, line=first_line,
+                     error=str(getattr(error, 'orig', error)).strip())
+    else:
+        report.imported += len(chunk)
+    report.chunks += 1
+
+
+def copy_chunk(engine, chunk):
+    # COPY ... FROM STDIN straight through psycopg2, in COPY text format
+    buffer = io.StringIO()
+    for row in chunk:
+        buffer.write('\t'.join(copy_text(row[column]) for column in (
+            'question', 'answer', 'difficulty', 'category')) + '\n')
+    buffer.seek(0)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.copy_expert(
+            'COPY questions (question, answer, difficulty, category) '
+            'FROM STDIN', buffer)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()